@@ -0,0 +1,188 @@
+"""
+Aggregates.py
+滚动窗口聚合：每轮数据追加到历史存储时增量更新各路段在多个时间窗口 (如 5 分钟、15 分钟、1 小时) 内的
+平均/最小/最大车速、各拥堵等级占比、拥堵方向计数及拥堵等级变化次数。
+每条记录进入和离开窗口时各做一次常数时间的累加/扣减，最小/最大值使用单调队列维护，
+查询时直接返回累计值，不读取原始历史。
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from HistoryStore import HistoryRow, g_history_store
+
+# 默认聚合窗口(秒)
+DEFAULT_WINDOWS = (300, 900, 3600)
+
+
+class _WindowAggregate:
+    """单个路段、单个时间窗口的增量聚合状态。"""
+
+    __slots__ = ("span", "samples", "speed_sum", "speed_count", "status_counts", "jam_counts",
+                 "transitions", "min_queue", "max_queue")
+
+    def __init__(self, span: float):
+        self.span = span
+        # (时间戳, 拥堵等级, 拥堵方向, 车速, 是否发生等级变化)
+        self.samples: Deque[Tuple[float, int, int, float, int]] = deque()
+        self.speed_sum = 0.0
+        self.speed_count = 0
+        self.status_counts: Dict[int, int] = {}
+        self.jam_counts: Dict[int, int] = {}
+        self.transitions = 0
+        # 单调队列：(时间戳, 车速)，队首分别为窗口内最小/最大车速
+        self.min_queue: Deque[Tuple[float, float]] = deque()
+        self.max_queue: Deque[Tuple[float, float]] = deque()
+
+    def add(self, epoch: float, status: int, jam: int, speed: float, transition: int) -> None:
+        self.samples.append((epoch, status, jam, speed, transition))
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.jam_counts[jam] = self.jam_counts.get(jam, 0) + 1
+        self.transitions += transition
+        if speed >= 0:
+            self.speed_sum += speed
+            self.speed_count += 1
+            while self.min_queue and self.min_queue[-1][1] >= speed:
+                self.min_queue.pop()
+            self.min_queue.append((epoch, speed))
+            while self.max_queue and self.max_queue[-1][1] <= speed:
+                self.max_queue.pop()
+            self.max_queue.append((epoch, speed))
+        self.evict(epoch)
+
+    def evict(self, now: float) -> None:
+        """移出时间戳不在 (now - span, now] 内的记录。"""
+        cutoff = now - self.span
+        samples = self.samples
+        while samples and samples[0][0] <= cutoff:
+            _epoch, status, jam, speed, transition = samples.popleft()
+            self._decrement(self.status_counts, status)
+            self._decrement(self.jam_counts, jam)
+            self.transitions -= transition
+            if speed >= 0:
+                self.speed_sum -= speed
+                self.speed_count -= 1
+        while self.min_queue and self.min_queue[0][0] <= cutoff:
+            self.min_queue.popleft()
+        while self.max_queue and self.max_queue[0][0] <= cutoff:
+            self.max_queue.popleft()
+        if not self.speed_count:
+            # 窗口内无有效车速时清零，避免浮点累计误差残留
+            self.speed_sum = 0.0
+
+    @staticmethod
+    def _decrement(counts: Dict[int, int], key: int) -> None:
+        remaining = counts[key] - 1
+        if remaining:
+            counts[key] = remaining
+        else:
+            del counts[key]
+
+    def snapshot(self) -> dict:
+        total = len(self.samples)
+        return {
+            "samples": total,
+            "from": self.samples[0][0] if total else None,
+            "to": self.samples[-1][0] if total else None,
+            "speedMean": round(self.speed_sum / self.speed_count, 2) if self.speed_count else None,
+            "speedMin": round(self.min_queue[0][1], 2) if self.min_queue else None,
+            "speedMax": round(self.max_queue[0][1], 2) if self.max_queue else None,
+            # 按采样次数计算的占比，轮询间隔固定时即为时间占比
+            "statusShare": {str(k): round(v / total, 4) for k, v in sorted(self.status_counts.items())},
+            "jamCounts": {str(k): v for k, v in sorted(self.jam_counts.items())},
+            "transitions": self.transitions,
+        }
+
+
+class TrafficAggregates:
+    """所有路段的滚动窗口聚合，作为历史存储的新数据回调增量更新。"""
+
+    def __init__(self, windows: Iterable[int] = DEFAULT_WINDOWS):
+        """
+        :param
+            windows (Iterable[int]): 聚合窗口长度(秒)。
+        :return
+            None
+        """
+        self._lock = threading.Lock()
+        self.windows: Tuple[int, ...] = ()
+        self._segments: Dict[int, List[_WindowAggregate]] = {}
+        self._last_status: Dict[int, int] = {}
+        self._registered = False
+        self.configure(windows)
+
+    def configure(self, windows: Iterable[int]) -> None:
+        """设置聚合窗口；窗口变化时清空已有聚合。"""
+        windows = tuple(sorted({int(w) for w in windows if int(w) > 0}))
+        with self._lock:
+            if windows == self.windows:
+                return
+            self.windows = windows
+            self._segments.clear()
+            self._last_status.clear()
+
+    def register(self) -> None:
+        """注册为 g_history_store 的新数据回调，可重复调用。"""
+        if not self._registered:
+            g_history_store.add_listener(self.on_frame)
+            self._registered = True
+
+    def add_rows(self, rows: Iterable[HistoryRow]) -> None:
+        """按时间顺序将记录计入各窗口。
+        :param
+            rows (Iterable[HistoryRow]): 历史记录。
+        :return
+            None
+        """
+        with self._lock:
+            for row in rows:
+                aggregates = self._segments.get(row.seg_id)
+                if aggregates is None:
+                    aggregates = self._segments[row.seg_id] = [_WindowAggregate(w) for w in self.windows]
+                # 只在两次有效拥堵等级之间统计变化，失败 (-2) 和熔断 (-3) 不计
+                transition = 0
+                if row.traffic_status >= 0:
+                    previous = self._last_status.get(row.seg_id)
+                    transition = int(previous is not None and previous != row.traffic_status)
+                    self._last_status[row.seg_id] = row.traffic_status
+                for aggregate in aggregates:
+                    aggregate.add(row.epoch, row.traffic_status, row.jam_direction, row.speed, transition)
+
+    def on_frame(self, generation: int, rows: List[HistoryRow]) -> None:
+        """历史存储新数据回调。"""
+        self.add_rows(rows)
+
+    def read(self, seg_ids: Optional[Iterable[int]] = None, window: Optional[int] = None,
+             now: Optional[float] = None) -> Dict[int, Dict[str, dict]]:
+        """读取聚合结果，先按当前时间移出过期记录。
+        :param
+            seg_ids (Optional[Iterable[int]]): 路段 ID，None 表示全部路段。
+            window (Optional[int]): 只返回指定长度的窗口(秒)，None 表示全部窗口。
+            now (Optional[float]): 当前时间 (Unix 时间戳)，默认取当前时间。
+        :return
+            Dict[int, Dict[str, dict]]: seg_id -> 窗口长度(秒, 字符串) -> 聚合结果。
+        """
+        if window is not None and window not in self.windows:
+            raise ValueError(f"未配置的聚合窗口: {window}，可选 {list(self.windows)}")
+        if now is None:
+            now = time.time()
+        result = {}
+        with self._lock:
+            targets = self._segments.keys() if seg_ids is None else seg_ids
+            for seg_id in targets:
+                aggregates = self._segments.get(seg_id)
+                if aggregates is None:
+                    continue
+                windows = {}
+                for aggregate in aggregates:
+                    if window is not None and aggregate.span != window:
+                        continue
+                    aggregate.evict(now)
+                    windows[str(aggregate.span)] = aggregate.snapshot()
+                result[seg_id] = windows
+        return result
+
+
+# 全局滚动窗口聚合
+g_aggregates = TrafficAggregates()
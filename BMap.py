@@ -4,13 +4,57 @@ BMap.py
 """
 import csv
 import requests
+from requests.adapters import HTTPAdapter
 import json
-import time
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple
-
-from globals import RoutineBMapData, g_data_lock, g_history_data, RoadSegment, TrafficResult
+from typing import Dict, List, Optional, Tuple
+
+# 可选的高性能 JSON 后端：安装了 orjson 时用其解析响应，否则使用标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    json_loads = json.loads
+    JSON_BACKEND = "json"
+
+from Aggregates import g_aggregates
+from globals import RoutineBMapData, g_data_lock, g_history_data, RoadSegment, TrafficResult, TrafficTaskConfig
+from HistoryFile import TrafficHistoryFile
+from HistoryStore import g_history_store
+from RateLimiter import TokenBucket
+from RawArchive import TrafficRawArchive
+from Metrics import g_metrics
+from Resilience import CircuitBreaker, g_circuit_breakers
+from SpatialIndex import g_spatial_index
+from ResultWriter import TrafficResultWriter
+
+
+# ================= 指标 =================
+
+# 请求类型 -> 日志描述
+_ENDPOINT_LABELS = {"traffic": "获取交通状态", "route": "获取路径规划"}
+
+API_LATENCY = {ep: g_metrics.histogram("bmap_api_request_seconds", "百度 API 单次请求耗时", {"endpoint": ep})
+               for ep in _ENDPOINT_LABELS}
+API_REQUESTS = {ep: g_metrics.counter("bmap_api_requests_total", "百度 API 请求次数", {"endpoint": ep})
+                for ep in _ENDPOINT_LABELS}
+API_FAILURES = {ep: g_metrics.counter("bmap_api_failures_total", "百度 API 请求失败次数", {"endpoint": ep})
+                for ep in _ENDPOINT_LABELS}
+API_RETRIES = {ep: g_metrics.counter("bmap_api_retries_total", "百度 API 重试次数", {"endpoint": ep})
+               for ep in _ENDPOINT_LABELS}
+CYCLE_BUCKETS = (0.5, 1, 2, 5, 10, 15, 20, 25, 30, 45, 60, 120)
+CYCLE_SECONDS = g_metrics.histogram("bmap_cycle_seconds", "单轮轮询总耗时", buckets=CYCLE_BUCKETS)
+CYCLE_PARSE_SECONDS = g_metrics.histogram("bmap_cycle_parse_seconds", "单轮响应解析总耗时")
+LAST_CYCLE_SECONDS = g_metrics.gauge("bmap_last_cycle_seconds", "最近一轮轮询耗时")
+LAST_CYCLE_ID = g_metrics.gauge("bmap_last_cycle_id", "最近一轮的轮次 ID")
+BREAKER_SKIPPED = g_metrics.counter("bmap_breaker_skipped_total", "因熔断跳过的路段查询次数")
+API_REQUESTS_SAVED = g_metrics.counter("bmap_api_requests_saved_total", "URL 去重节省的百度 API 请求次数")
+ROUTE_CALLS_SKIPPED = g_metrics.counter("bmap_route_calls_skipped_total", "自适应模式下沿用上次车速而跳过的路径规划次数")
 
 
 # ================= 辅助函数：安全读取 =================
@@ -35,15 +79,131 @@ def get_latest_history_safe() -> List[RoutineBMapData]:
     return snapshot
 
 
+# ================= 启动预热 =================
+
+def warm_start_history(task_config: TrafficTaskConfig) -> int:
+    """
+    启动时从持久化历史文件恢复最近 warm_start_frames 轮数据到内存，并续接轮次 ID，
+    恢复的数据同时计入滚动窗口聚合。错峰模式下每帧只含部分路段，改为按时间恢复相当于各路段 warm_start_frames 轮的数据。
+    轮次 ID 取历史文件与原始归档索引中较大的一个，只启用原始归档时同样续接，保证归档索引按轮次递增。
+    内存中已有数据时不做任何操作，可重复调用。
+    :param
+        task_config (TrafficTaskConfig): 任务配置。
+    :return
+        int: 恢复的记录条数。
+    """
+    if g_history_store.generation > 0:
+        return 0
+    last_cycle_id = TrafficRawArchive(task_config.raw_archive_dir).last_cycle_id() \
+        if task_config.raw_archive_dir else 0
+    rows = []
+    if task_config.history_file:
+        g_history_store.resize(task_config.history_depth)
+        history_file = TrafficHistoryFile(task_config.history_file)
+        try:
+            if task_config.scheduler_mode == "staggered":
+                # 错峰模式每帧只含部分路段，按时间恢复：覆盖最长轮询间隔的 warm_start_frames 倍
+                longest = max([task_config.interval_seconds] + list(task_config.grade_intervals.values()))
+                rows = history_file.tail_seconds(task_config.warm_start_frames * longest)
+            else:
+                rows = history_file.tail_rows(task_config.warm_start_frames)
+            last_cycle_id = max(last_cycle_id, history_file.last_cycle_id())
+            g_aggregates.configure(task_config.aggregate_windows)
+            g_aggregates.add_rows(rows)
+        except Exception as e:
+            print(f"[Error] 加载历史文件失败: {e}")
+            rows = []
+        finally:
+            history_file.close()
+    g_history_store.load_rows(rows, last_cycle_id)
+    if rows:
+        print(f"已从历史文件恢复 {len(rows)} 条记录。")
+    elif last_cycle_id:
+        print(f"轮次 ID 从 {last_cycle_id + 1} 继续。")
+    return len(rows)
+
+
+# ================= 辅助函数：响应解析 =================
+
+def parse_traffic_status(seg: RoadSegment, data: dict) -> Tuple[int, int]:
+    """从交通态势响应中提取拥堵等级，并按路段名称/方向判断拥堵方向。
+    :param
+        seg (RoadSegment): 路段对象。
+        data (dict): 已解析的响应。
+    :return
+        Tuple[int, int]: (拥堵等级, 拥堵方向)。
+    """
+    traffic_stat = int(data.get("evaluation", {}).get("status", 0))
+    jam_drct = 0
+
+    for rt in data.get("road_traffic", []):
+        if seg.name and seg.name != rt.get("road_name", ""):
+            continue
+        for section in rt.get("congestion_sections", []):
+            section_desc = section.get("section_desc", "")
+            if seg.direction and seg.direction in section_desc:
+                jam_drct = 1
+                break
+            elif section_desc:
+                jam_drct = -1
+        if jam_drct == 1:
+            break
+
+    return traffic_stat, jam_drct
+
+
+def traffic_signature(seg: RoadSegment, data: dict) -> tuple:
+    """交通态势签名：整体拥堵等级及本路段所属道路的拥堵路段描述，用于判断态势是否变化。
+    :param
+        seg (RoadSegment): 路段对象。
+        data (dict): 已解析的响应。
+    :return
+        tuple: 签名，两次相同表示交通态势未变化。
+    """
+    sections = tuple(
+        section.get("section_desc", "")
+        for rt in data.get("road_traffic", []) if not seg.name or seg.name == rt.get("road_name", "")
+        for section in rt.get("congestion_sections", [])
+    )
+    return data.get("evaluation", {}).get("status", 0), sections
+
+
+def parse_route_speed(data: dict) -> float:
+    """从路径规划响应中提取距离与耗时，计算平均车速 (km/h)。
+    :param
+        data (dict): 已解析的响应。
+    :return
+        float: 车速，无结果时为 0。
+    """
+    result = data.get("result", [])
+    if result:
+        dist = float(result[0]["distance"]["value"])
+        dur = float(result[0]["duration"]["value"])
+        return (dist / dur) * 3.6 if dur > 0 else 0.0
+    return 0.0
+
+
+class _RouteState:
+    """自适应路径规划模式下单个路段的状态。"""
+
+    __slots__ = ("signature", "stable_cycles", "speed", "refreshed_at")
+
+    def __init__(self):
+        self.signature = None      # 上次的交通态势签名
+        self.stable_cycles = 0     # 交通态势连续不变的轮数
+        self.speed = None          # 最近一次成功请求得到的车速
+        self.refreshed_at = 0.0    # 最近一次请求路径规划的时间 (Unix 时间戳)
+
+
 # ================= 核心管理类 =================
 
 class TrafficManager:
     """交通数据管理器，负责配置加载、API轮询、数据存储及内存容器维护。"""
 
-    def __init__(self, config_file: str, output_dir: str = "./data"):
+    def __init__(self, task_config: TrafficTaskConfig, output_dir: str = "./data"):
         """初始化管理器，创建输出目录、加载配置。
         :param
-            config_file (str): CSV 配置文件路径。
+            task_config (TrafficTaskConfig): 任务配置，路段文件路径取自 segment_table_path。
             output_dir (str): 结果文件存储目录，默认为 "./data"。
         :return
             None
@@ -51,8 +211,28 @@ class TrafficManager:
         self.segments: List[RoadSegment] = []
         self.output_dir = output_dir
 
-        # 加载配置
-        self.load_config(config_file)
+        self.init_fetching(task_config)
+        # 多进程分片轮询，由 traffic_monitor_task 按 shard_processes 配置挂载
+        self.shard_pool = None
+        # 最近写入一帧的时间，保证写入历史的帧时间单调不减
+        self._last_frame_time = 0.0
+
+        # 加载配置；若尚未预热，先从历史文件恢复内存历史并续接轮次 ID
+        self.load_config(task_config.segment_table_path)
+        self.log_url_sharing(self.segments)
+        g_history_store.resize(task_config.history_depth)
+        g_aggregates.configure(task_config.aggregate_windows)
+        warm_start_history(task_config)
+        # 每轮数据追加到历史存储时增量更新滚动窗口聚合
+        g_aggregates.register()
+
+        # 每个路段一个熔断器，同时登记到全局表供 TCP 服务查询
+        self.breakers = {
+            seg.id: CircuitBreaker(seg.id, task_config.breaker_failure_threshold, task_config.breaker_cooldown_seconds)
+            for seg in self.segments
+        }
+        g_circuit_breakers.clear()
+        g_circuit_breakers.update(self.breakers)
 
         # 准备输出文件路径
         if not os.path.exists(output_dir):
@@ -62,8 +242,46 @@ class TrafficManager:
         self.csv_filename = os.path.join(output_dir, f"{current_time_str}_Result.csv")
         self.log_filename = os.path.join(output_dir, f"{current_time_str}_RawJson.txt")
 
-        # 初始化 CSV 表头
-        self.init_csv_header()
+        # 后台写入线程负责 CSV 表头及后续所有文件写入
+        history_file = TrafficHistoryFile(task_config.history_file) if task_config.history_file else None
+        raw_archive = TrafficRawArchive(task_config.raw_archive_dir) if task_config.raw_archive_dir else None
+        self.writer = TrafficResultWriter(
+            self.csv_filename, self.log_filename if task_config.raw_text_log else None,
+            fsync=task_config.fsync_each_cycle, history_file=history_file, raw_archive=raw_archive,
+            metrics_dump_path=task_config.metrics_dump_path or None
+        )
+
+    def init_fetching(self, task_config: TrafficTaskConfig) -> None:
+        """初始化请求相关的资源：查询线程池、限流器、重试策略、HTTP 连接池等。
+        :param
+            task_config (TrafficTaskConfig): 任务配置。
+        :return
+            None
+        """
+        # 并发查询：线程池 + 全局令牌桶限流，取代固定的 sleep 间隔
+        self.fetch_workers = max(1, task_config.fetch_workers)
+        self.rate_limiter = TokenBucket(task_config.qps_limit)
+        self.executor = None
+        if self.fetch_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="BMapFetch")
+
+        # 重试策略，每轮（或每批）的截止时间由 new_deadline 生成并随调用传入
+        self.retry_policy = task_config.retry_policy
+
+        # 自适应路径规划：交通态势稳定时跳过路径规划请求
+        self.adaptive_route = task_config.adaptive_route
+        self.route_stable_cycles = max(1, task_config.route_stable_cycles)
+        self.route_max_staleness = task_config.route_max_staleness_seconds
+        self._route_state: Dict[int, _RouteState] = {}
+
+        # 每轮响应解析耗时统计
+        self._parse_lock = threading.Lock()
+        self._parse_seconds = 0.0
+        self._parse_count = 0
+
+        # 长连接池：所有路段、所有轮次复用同一组 TCP/TLS 连接
+        self.http_timeout = (task_config.connect_timeout, task_config.read_timeout)
+        self.session = self.create_session(task_config.http_pool_size or self.fetch_workers)
 
     def load_config(self, file_path: str) -> None:
         """从 CSV 文件加载路段配置信息到内存。
@@ -90,127 +308,363 @@ class TrafficManager:
                     )
                     self.segments.append(seg)
             print(f"成功加载 {len(self.segments)} 条路段配置。")
+            # 按路段坐标构建空间索引，供 TCP 服务的 bbox / near 查询
+            g_spatial_index.build(self.segments)
         except Exception as e:
             print(f"[Error] 加载配置文件失败: {e}")
 
-    def init_csv_header(self) -> None:
-        """初始化 CSV 结果文件的表头，若文件不存在则创建。
+    @staticmethod
+    def log_url_sharing(segments: List[RoadSegment]) -> None:
+        """统计路段间共用的 URL 并输出：query_segments 每轮对 URL 去重，同一 URL 只请求一次。
+        道路级交通态势查询通常覆盖双向，配置为两个路段时共用同一个 traffic_url。
         :param
+            segments (List[RoadSegment]): 路段列表。
+        :return
             None
+        """
+        traffic_urls = len({seg.traffic_url for seg in segments})
+        route_urls = len({seg.route_url for seg in segments})
+        total = 2 * len(segments)
+        unique = traffic_urls + route_urls
+        if total:
+            print(f"URL 去重: 交通态势 {traffic_urls} 个 URL / 路径规划 {route_urls} 个 URL，"
+                  f"全量轮询每轮最多 {unique} 次请求 (去重前 {total} 次，节省 {total - unique} 次)。")
+
+    @staticmethod
+    def create_session(pool_size: int) -> requests.Session:
+        """创建带连接池的 HTTP 会话，连接池大小应不小于并发查询线程数。
+        :param
+            pool_size (int): 每个主机保持的最大连接数。
+        :return
+            requests.Session: 已挂载连接池适配器的会话对象。
+        """
+        session = requests.Session()
+        # 重试由 fetch_* 方法自行控制，适配器层不再重试
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(1, pool_size), max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def record_parse_time(self, seconds: float, count: int = 1) -> None:
+        """累计本轮响应解析耗时，可在多个查询线程中并发调用。
+        :param
+            seconds (float): 本次解析耗时。
+            count (int): 计入的响应个数，字段提取等后续步骤传 0 只累加耗时。
         :return
             None
         """
-        if not os.path.exists(self.csv_filename):
-            with open(self.csv_filename, mode='w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["Time", "SegID", "TrafficStatus", "JamDirection", "Speed(km/h)"])
-
-    def fetch_traffic_status(self, seg: RoadSegment) -> Tuple[int, int, str]:
-        """调用百度 API 获取交通拥堵态势，并解析拥堵方向。
+        with self._parse_lock:
+            self._parse_seconds += seconds
+            self._parse_count += count
+
+    def request_json(self, url: str, seg: RoadSegment, endpoint: str,
+                     deadline: Optional[float] = None) -> Optional[Tuple[dict, bytes]]:
+        """按重试策略请求百度 API，返回解析后的响应及原始字节。
+        失败后按指数退避加抖动等待再重试，超过最大次数或本轮截止时间则放弃。
         :param
-            seg (RoadSegment): 当前要查询的路段对象。
+            url (str): 请求地址。
+            seg (RoadSegment): 当前路段，用于日志。
+            endpoint (str): 请求类型，"traffic" 或 "route"。
+            deadline (Optional[float]): 本轮重试截止时间 (time.monotonic)，None 表示不限制。
         :return
-            Tuple[int, int, str]: (拥堵等级, 拥堵方向, 原始JSON)。
+            Optional[Tuple[dict, bytes]]: (解析后的响应, 原始响应字节)，全部失败时返回 None。
         """
-        retry_count = 0
-        max_retries = 5
-        traffic_stat = 0
-        jam_drct = 0
+        policy = self.retry_policy
+        label = _ENDPOINT_LABELS[endpoint]
+        attempt = 0
 
-        while retry_count < max_retries:
+        while attempt < policy.max_attempts:
+            if attempt > 0:
+                API_RETRIES[endpoint].inc()
             try:
-                time.sleep(0.3)
-                response = requests.get(seg.traffic_url, timeout=5)
+                self.rate_limiter.acquire()
+                API_REQUESTS[endpoint].inc()
+                request_start = time.perf_counter()
+                try:
+                    response = self.session.get(url, timeout=self.http_timeout)
+                finally:
+                    API_LATENCY[endpoint].observe(time.perf_counter() - request_start)
                 if response.status_code != 200:
                     raise Exception(f"HTTP {response.status_code}")
 
-                data = response.json()
+                # 原始响应字节直接留作持久化，不再 loads 后重新 dumps
+                body = response.content
+                parse_start = time.perf_counter()
+                data = json_loads(body)
+                self.record_parse_time(time.perf_counter() - parse_start)
                 if "成功" not in data.get("message", ""):
-                    retry_count += 1
-                    continue
-
-                traffic_stat = int(data.get("evaluation", {}).get("status", 0))
-                jam_drct = 0
-                road_traffic_list = data.get("road_traffic", [])
-
-                for rt in road_traffic_list:
-                    if seg.name and seg.name != rt.get("road_name", ""):
-                        continue
-                    for section in rt.get("congestion_sections", []):
-                        section_desc = section.get("section_desc", "")
-                        if seg.direction and seg.direction in section_desc:
-                            jam_drct = 1
-                            break
-                        elif section_desc:
-                            jam_drct = -1
-                    if jam_drct == 1:
-                        break
-
-                return traffic_stat, jam_drct, json.dumps(data, ensure_ascii=False)
+                    raise Exception(f"API 返回: {data.get('message', '')}")
+                return data, body
 
             except Exception as e:
-                retry_count += 1
-                print(f"[Error] 获取交通状态失败 (Seg {seg.id}): {e}")
+                attempt += 1
+                API_FAILURES[endpoint].inc()
+                print(f"[Error] {label}失败 (Seg {seg.id}, 第 {attempt} 次): {e}")
+
+            if attempt >= policy.max_attempts:
+                break
+            delay = policy.backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                print(f"[Error] {label}放弃重试 (Seg {seg.id}): 超出本轮截止时间")
+                break
+            time.sleep(delay)
+
+        return None
+
+    def traffic_from_response(self, seg: RoadSegment, resp: Optional[Tuple[dict, str]]) -> Tuple[int, int, str]:
+        """从交通态势响应中按路段名称/方向解析拥堵等级与拥堵方向，同一响应可供多个路段分别解析。
+        :param
+            seg (RoadSegment): 当前要解析的路段对象。
+            resp (Optional[Tuple[dict, str]]): (解析后的响应, 原始JSON)，请求失败时为 None。
+        :return
+            Tuple[int, int, str]: (拥堵等级, 拥堵方向, 原始JSON)，失败时为 (-2, -2, "{}")。
+        """
+        if resp is None:
+            return -2, -2, "{}"
+        data, raw_json = resp
+        parse_start = time.perf_counter()
+        traffic_stat, jam_drct = parse_traffic_status(seg, data)
+        self.record_parse_time(time.perf_counter() - parse_start, count=0)
+        return traffic_stat, jam_drct, raw_json
+
+    def route_from_response(self, resp: Optional[Tuple[dict, str]]) -> Tuple[float, str]:
+        """从路径规划响应中计算平均车速。
+        :param
+            resp (Optional[Tuple[dict, str]]): (解析后的响应, 原始JSON)，请求失败时为 None。
+        :return
+            Tuple[float, str]: (车速km/h, 原始JSON)，失败时为 (-2.0, "{}")。
+        """
+        if resp is None:
+            return -2.0, "{}"
+        data, raw_json = resp
+        parse_start = time.perf_counter()
+        speed = parse_route_speed(data)
+        self.record_parse_time(time.perf_counter() - parse_start, count=0)
+        return speed, raw_json
+
+    def fetch_url(self, endpoint: str, url: str, seg: RoadSegment,
+                  deadline: Optional[float] = None) -> Optional[Tuple[dict, str]]:
+        """请求一个 URL，返回解析后的响应及解码后的原始 JSON，供共用该 URL 的所有路段使用。
+        :param
+            endpoint (str): 请求类型，"traffic" 或 "route"。
+            url (str): 请求地址。
+            seg (RoadSegment): 共用该 URL 的第一个路段，用于日志。
+            deadline (Optional[float]): 本轮重试截止时间 (time.monotonic)，None 表示不限制。
+        :return
+            Optional[Tuple[dict, str]]: (解析后的响应, 原始JSON)，失败时返回 None。
+        """
+        resp = self.request_json(url, seg, endpoint, deadline)
+        if resp is None:
+            return None
+        data, body = resp
+        return data, body.decode('utf-8', errors='replace')
 
-        return -2, -2, "{}"
+    def fetch_traffic_status(self, seg: RoadSegment) -> Tuple[int, int, str]:
+        """调用百度 API 获取交通拥堵态势，并解析拥堵方向。
+        :param
+            seg (RoadSegment): 当前要查询的路段对象。
+        :return
+            Tuple[int, int, str]: (拥堵等级, 拥堵方向, 原始JSON)，失败时为 (-2, -2, "{}")。
+        """
+        return self.traffic_from_response(seg, self.fetch_url("traffic", seg.traffic_url, seg))
 
     def fetch_route_speed(self, seg: RoadSegment) -> Tuple[float, str]:
         """调用百度 API 获取路径规划数据，并计算平均车速。
         :param seg:
             seg (RoadSegment): 当前要查询的路段对象。
         :return
-            Tuple[float, str]: (车速km/h, 原始JSON)。
+            Tuple[float, str]: (车速km/h, 原始JSON)，失败时为 (-2.0, "{}")。
         """
-        retry_count = 0
-        max_retries = 5
-        speed = 0.0
-
-        while retry_count < max_retries:
-            try:
-                time.sleep(0.3)
-                response = requests.get(seg.route_url, timeout=5)
-                if response.status_code != 200:
-                    raise Exception(f"HTTP {response.status_code}")
-
-                data = response.json()
-                if "成功" not in data.get("message", ""):
-                    retry_count += 1
-                    continue
+        return self.route_from_response(self.fetch_url("route", seg.route_url, seg))
 
-                result = data.get("result", [])
-                if result:
-                    dist = float(result[0]["distance"]["value"])
-                    dur = float(result[0]["duration"]["value"])
-                    speed = (dist / dur) * 3.6 if dur > 0 else 0.0
+    def fetch_jobs(self, jobs: Dict[Tuple[str, str], RoadSegment],
+                   deadline: Optional[float] = None) -> Dict[Tuple[str, str], Optional[Tuple[dict, str]]]:
+        """并发请求一组唯一的 (请求类型, URL)。
+        :param
+            jobs (Dict[Tuple[str, str], RoadSegment]): (请求类型, URL) -> 用于日志的路段。
+            deadline (Optional[float]): 本轮重试截止时间 (time.monotonic)，None 表示不限制。
+        :return
+            Dict[Tuple[str, str], Optional[Tuple[dict, str]]]: (请求类型, URL) -> 响应，失败为 None。
+        """
+        def _fetch(job):
+            (endpoint, url), seg = job
+            return self.fetch_url(endpoint, url, seg, deadline)
 
-                return speed, json.dumps(data, ensure_ascii=False)
+        if self.executor is not None and len(jobs) > 1:
+            return dict(zip(jobs, self.executor.map(_fetch, jobs.items())))
+        return {key: _fetch((key, seg)) for key, seg in jobs.items()}
 
-            except Exception as e:
-                retry_count += 1
-                print(f"[Error] 获取路径规划失败 (Seg {seg.id}): {e}")
+    def route_needed(self, seg: RoadSegment, signature: Optional[tuple], now: float) -> bool:
+        """自适应路径规划：判断本轮是否需要请求该路段的路径规划。
+        交通态势变化、请求失败、连续稳定不足 route_stable_cycles 轮或沿用时间超过上限时需要请求。
+        :param
+            seg (RoadSegment): 路段对象。
+            signature (Optional[tuple]): 本轮交通态势签名，交通态势请求失败时为 None。
+            now (float): 当前时间 (Unix 时间戳)。
+        :return
+            bool: 是否需要请求。
+        """
+        state = self._route_state.get(seg.id)
+        if state is None:
+            state = self._route_state[seg.id] = _RouteState()
+        if signature is None or signature != state.signature:
+            state.signature = signature
+            state.stable_cycles = 0
+            return True
+        state.stable_cycles += 1
+        if state.speed is None or state.stable_cycles < self.route_stable_cycles:
+            return True
+        return now - state.refreshed_at >= self.route_max_staleness
+
+    def query_segments(self, segs: List[RoadSegment], now_str: str,
+                       deadline: Optional[float] = None) -> RoutineBMapData:
+        """查询一组路段：先对 URL 去重并发请求，再将响应分发给各路段分别解析。
+        自适应路径规划模式下先请求交通态势，再只为需要刷新车速的路段请求路径规划。
+        :param
+            segs (List[RoadSegment]): 要查询的路段，结果顺序与之一致。
+            now_str (str): 本轮轮询的时间戳字符串。
+            deadline (Optional[float]): 本轮重试截止时间 (time.monotonic)，由 new_deadline 生成，None 表示不限制。
+                分片模式下由各分片进程自行计算。
+        :return
+            RoutineBMapData: 各路段本轮的查询结果。
+        """
+        if self.shard_pool is not None:
+            return self.shard_pool.query_segments(segs, now_str)
+
+        # 熔断中的路段不参与请求
+        allowed = []
+        for seg in segs:
+            if self.breakers[seg.id].allow():
+                allowed.append(seg)
+            else:
+                BREAKER_SKIPPED.inc()
+        allowed_ids = {seg.id for seg in allowed}
+
+        # 收集本轮需要请求的唯一 URL，按首次出现的路段记录日志
+        jobs: Dict[Tuple[str, str], RoadSegment] = {}
+        for seg in allowed:
+            print(f"Processing[{now_str}] Seg {seg.id}...", end='\n')
+            jobs.setdefault(("traffic", seg.traffic_url), seg)
+            if not self.adaptive_route:
+                jobs.setdefault(("route", seg.route_url), seg)
+        responses = self.fetch_jobs(jobs, deadline)
+        requested = len(jobs)
+
+        # 自适应模式：根据交通态势决定哪些路段刷新车速，其余沿用上次结果
+        carried_ids = set()
+        if self.adaptive_route:
+            now = time.time()
+            route_jobs: Dict[Tuple[str, str], RoadSegment] = {}
+            for seg in allowed:
+                resp = responses[("traffic", seg.traffic_url)]
+                signature = traffic_signature(seg, resp[0]) if resp is not None else None
+                if self.route_needed(seg, signature, now):
+                    route_jobs.setdefault(("route", seg.route_url), seg)
+                else:
+                    carried_ids.add(seg.id)
+            if carried_ids:
+                ROUTE_CALLS_SKIPPED.inc(len(carried_ids))
+                print(f"[Cycle] 交通态势稳定，{len(carried_ids)} 个路段沿用上次车速")
+            responses.update(self.fetch_jobs(route_jobs, deadline))
+            requested += len(route_jobs)
+
+        saved = 2 * len(allowed) - len(carried_ids) - requested
+        if saved > 0:
+            API_REQUESTS_SAVED.inc(saved)
+            print(f"[Cycle] {len(allowed)} 个路段共请求 {requested} 个 URL，去重节省 {saved} 次请求")
+
+        results = []
+        for seg in segs:
+            if seg.id not in allowed_ids:
+                # 熔断中的路段本轮不请求，以 -3 标记
+                results.append(TrafficResult(
+                    seg_id=seg.id, timestamp=now_str,
+                    traffic_status=-3, jam_direction=-3, speed=-3.0,
+                    raw_json_traffic="{}", raw_json_route="{}"
+                ))
+                continue
+
+            t_stat, j_drct, t_json = self.traffic_from_response(seg, responses[("traffic", seg.traffic_url)])
+            carried = seg.id in carried_ids
+            if carried:
+                spd, r_json = self._route_state[seg.id].speed, "{}"
+            else:
+                spd, r_json = self.route_from_response(responses[("route", seg.route_url)])
+                if self.adaptive_route:
+                    state = self._route_state[seg.id]
+                    # 请求失败时不保留旧车速，下轮重新请求
+                    state.speed = spd if spd != -2.0 else None
+                    state.refreshed_at = time.time()
+
+            breaker = self.breakers[seg.id]
+            if t_stat == -2 or spd == -2.0:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
 
-        return -2.0, "{}"
+            # 创建结构体对象
+            results.append(TrafficResult(
+                seg_id=seg.id, timestamp=now_str,
+                traffic_status=t_stat, jam_direction=j_drct, speed=spd,
+                raw_json_traffic=t_json, raw_json_route=r_json, speed_carried=carried
+            ))
+        return results
 
-    def save_result(self, result: TrafficResult) -> None:
-        """将单次查询结果写入 CSV 和 JSON 日志文件。
+    def close(self) -> None:
+        """释放查询线程池、HTTP 连接池等资源，并等待写入线程写完剩余数据。
         :param
-            result (TrafficResult): 包含查询结果的对象。
+            None
         :return
             None
         """
-        try:
-            with open(self.csv_filename, mode='a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    result.timestamp, result.seg_id,
-                    result.traffic_status, result.jam_direction,
-                    f"{result.speed:.2f}"
-                ])
-            with open(self.log_filename, mode='a', encoding='utf-8') as f:
-                f.write(f"[{result.timestamp}] [ID:{result.seg_id}] TRAFFIC: {result.raw_json_traffic}\n")
-                f.write(f"[{result.timestamp}] [ID:{result.seg_id}] ROUTE:   {result.raw_json_route}\n")
-        except Exception as e:
-            print(f"[Error] 文件写入失败: {e}")
+        if self.shard_pool is not None:
+            self.shard_pool.close()
+            self.shard_pool = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.session.close()
+        self.writer.close()
+
+    def new_deadline(self) -> Optional[float]:
+        """按重试策略生成一轮（或一批）查询的重试截止时间 (time.monotonic)，不限制时返回 None。"""
+        if self.retry_policy.cycle_deadline > 0:
+            return time.monotonic() + self.retry_policy.cycle_deadline
+        return None
+
+    def begin_cycle(self) -> Optional[float]:
+        """开始一轮查询：重置解析耗时统计，返回本轮重试截止时间。"""
+        with self._parse_lock:
+            self._parse_seconds = 0.0
+            self._parse_count = 0
+        return self.new_deadline()
+
+    def report_parse_stats(self) -> None:
+        """输出并记录自上次重置以来的响应解析耗时，之后清零。"""
+        with self._parse_lock:
+            parse_seconds, parse_count = self._parse_seconds, self._parse_count
+            self._parse_seconds = 0.0
+            self._parse_count = 0
+        print(f"[Cycle] 本轮解析 {parse_count} 个响应，耗时 {parse_seconds * 1000:.2f} ms (JSON 后端: {JSON_BACKEND})")
+        CYCLE_PARSE_SECONDS.observe(parse_seconds)
+
+    def commit_frame(self, frame: RoutineBMapData, frame_time: float) -> int:
+        """将一帧结果追加到内存历史，并交给后台写入线程持久化，轮询线程不等待磁盘 I/O。
+        :param
+            frame (RoutineBMapData): 本帧的路段查询结果，可以只包含部分路段。
+            frame_time (float): 本帧开始时间 (Unix 时间戳)。
+        :return
+            int: 本帧分配到的轮次 ID。
+        """
+        if frame_time < self._last_frame_time:
+            # 历史文件与滚动聚合依赖时间单调不减，出现倒退时沿用上一帧时间
+            print(f"[Warning] 帧时间倒退 {self._last_frame_time - frame_time:.3f} 秒，按上一帧时间写入")
+            frame_time = self._last_frame_time
+        self._last_frame_time = frame_time
+        cycle_id = g_history_store.append_frame(frame, frame_time)
+        self.writer.submit_frame(frame, cycle_id, frame_time)
+        LAST_CYCLE_ID.set(cycle_id)
+        return cycle_id
 
     def task_query_all_segments(self) -> RoutineBMapData:
         """执行一次完整的轮询任务，遍历所有路段，保存数据，并更新内存中的历史容器。
@@ -219,46 +673,22 @@ class TrafficManager:
         :return
             RoutineBMapData: 返回当前轮询收集到的所有路段数据列表。
         """
-        now_str = datetime.now().strftime("%H:%M:%S")
+        cycle_time = time.time()
+        cycle_start = time.perf_counter()
+        now_str = datetime.fromtimestamp(cycle_time).strftime("%H:%M:%S")
         print(f"[Cycle] 开始轮询 - {now_str}",end='\n')
+        deadline = self.begin_cycle()
 
-        # 创建本轮数据的容器 (routine_bMap_data)
-        current_routine_data: RoutineBMapData = []
+        # 创建本轮数据的容器 (routine_bMap_data)，顺序与 self.segments 一致
+        current_routine_data: RoutineBMapData = self.query_segments(self.segments, now_str, deadline)
 
-        for seg in self.segments:
-            print(f"Processing[{now_str}] Seg {seg.id}...", end='\n')
+        self.report_parse_stats()
 
-            # 获取数据
-            t_stat, j_drct, t_json = self.fetch_traffic_status(seg)
-            spd, r_json = self.fetch_route_speed(seg)
-
-            # 创建结构体对象
-            res = TrafficResult(
-                seg_id=seg.id, timestamp=now_str,
-                traffic_status=t_stat, jam_direction=j_drct, speed=spd,
-                raw_json_traffic=t_json, raw_json_route=r_json
-            )
-
-            # 持久化存储到文件
-            self.save_result(res)
-
-            # 添加到本轮内存容器
-            current_routine_data.append(res)
-
-            time.sleep(0.3)  # 避免请求过快
-
-        # 轮询结束后，将本轮数据添加到全局历史容器
-        with g_data_lock:
-            g_history_data.append(current_routine_data)
-
-        try:
-            with open(self.csv_filename, mode='a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([])
-            with open(self.log_filename, mode='a', encoding='utf-8') as f:
-                f.write("\n")
-        except Exception as e:
-            print(f"[Error] 文件写入失败: {e}")
+        # 轮询结束后，将本轮数据添加到全局历史容器及分路段索引，并交给写入线程
+        self.commit_frame(current_routine_data, cycle_time)
 
+        cycle_seconds = time.perf_counter() - cycle_start
+        CYCLE_SECONDS.observe(cycle_seconds)
+        LAST_CYCLE_SECONDS.set(cycle_seconds)
 
-        return current_routine_data
\ No newline at end of file
+        return current_routine_data
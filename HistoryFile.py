@@ -0,0 +1,285 @@
+"""
+HistoryFile.py
+持久化历史文件：定长二进制记录、只追加写入，读取时使用内存映射。
+与 CSV 结果文件一同由写入线程写入，服务重启时可从文件尾部快速读取最近若干轮数据
+（预热逻辑见 BMap.warm_start_history），并为超过内存历史深度的查询提供数据来源。
+
+文件格式：32 字节文件头 (MAGIC + 版本号)，其后为连续的 32 字节记录：
+    cycle_id(q) epoch(d) seg_id(i) traffic_status(b) jam_direction(b) flags(B) 保留(x) speed(f) 保留(4x)
+flags 取值见 HistoryStore.FLAG_*。
+
+记录按轮次顺序追加，epoch 单调不减，因此文件本身即是按时间排序的索引，
+时间范围查询通过二分查找定位起止位置，无需全量扫描。
+单路段深度查询使用内存中的路段 -> 记录序号索引，索引随文件增长增量构建。
+"""
+import mmap
+import os
+import struct
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from HistoryStore import HistoryRow
+
+MAGIC = b"BMAPHIST"
+VERSION = 1
+HEADER = struct.Struct("<8sI20x")
+RECORD = struct.Struct("<qdibbBxf4x")
+# epoch / seg_id 字段在记录中的偏移，用于扫描时只解析需要的字段
+_EPOCH_OFFSET = 8
+_SEG_ID_OFFSET = 16
+_EPOCH = struct.Struct("<d")
+_SEG_ID = struct.Struct("<i")
+# 增量构建路段索引时每批解析的记录数，限制单次复制的内存
+_INDEX_CHUNK_RECORDS = 65536
+
+
+class TrafficHistoryFile:
+    """持久化历史文件的读写封装。写入由单一写入线程调用，读取可在任意线程进行。"""
+
+    def __init__(self, path: str):
+        """
+        :param
+            path (str): 历史文件路径，不存在时在首次写入时创建。
+        :return
+            None
+        """
+        self.path = path
+        self._write_handle = None
+        self._map_lock = threading.Lock()
+        self._map = None
+        self._map_size = 0
+        # seg_id -> 该路段记录序号（升序），覆盖前 _indexed 条记录
+        self._index_lock = threading.Lock()
+        self._index: Dict[int, array] = {}
+        self._indexed = 0
+
+    # ---------------- 写入 ----------------
+
+    def open_for_append(self):
+        """以追加模式打开文件，新文件先写入文件头。返回文件句柄，由写入线程负责 flush/close。"""
+        if self._write_handle is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            handle = open(self.path, mode='ab')
+            if handle.tell() == 0:
+                handle.write(HEADER.pack(MAGIC, VERSION))
+            elif handle.tell() < HEADER.size or (handle.tell() - HEADER.size) % RECORD.size:
+                # 上次写入中断留下半条记录，截断到整条记录边界
+                valid = max(HEADER.size, handle.tell() - (handle.tell() - HEADER.size) % RECORD.size)
+                handle.truncate(valid)
+                handle.seek(valid)
+            self._write_handle = handle
+        return self._write_handle
+
+    def append_rows(self, rows: List[HistoryRow]) -> None:
+        """追加一轮记录（不 flush）。
+        :param
+            rows (List[HistoryRow]): 本轮各路段记录，标志位取自 HistoryRow.flags。
+        :return
+            None
+        """
+        handle = self.open_for_append()
+        handle.write(b"".join(
+            RECORD.pack(r.cycle_id, r.epoch, r.seg_id, r.traffic_status, r.jam_direction, r.flags, r.speed)
+            for r in rows
+        ))
+
+    def flush(self, fsync: bool = False) -> None:
+        if self._write_handle is not None:
+            self._write_handle.flush()
+            if fsync:
+                os.fsync(self._write_handle.fileno())
+
+    def close(self) -> None:
+        if self._write_handle is not None:
+            self._write_handle.close()
+            self._write_handle = None
+        # 映射可能仍被其他读线程使用，只释放引用，由最后一个使用者释放后自动关闭
+        with self._map_lock:
+            self._map = None
+            self._map_size = 0
+
+    # ---------------- 读取 ----------------
+
+    def _snapshot(self) -> Tuple[mmap.mmap, int]:
+        """返回 (内存映射, 完整记录数)，文件增长后重新映射。
+        旧映射可能已交给其他读线程，不能在此关闭，只替换引用，引用全部释放后自动关闭。"""
+        with self._map_lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return None, 0
+            if size <= HEADER.size:
+                return None, 0
+            if self._map is None or size != self._map_size:
+                with open(self.path, mode='rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._map_size = size
+                if self._map[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"历史文件格式错误: {self.path}")
+            return self._map, (size - HEADER.size) // RECORD.size
+
+    @staticmethod
+    def _unpack(mm: mmap.mmap, index: int) -> HistoryRow:
+        cycle_id, epoch, seg_id, status, jam, flags, speed = RECORD.unpack_from(mm, HEADER.size + index * RECORD.size)
+        return HistoryRow(cycle_id, epoch, seg_id, status, jam, speed, flags)
+
+    def record_count(self) -> int:
+        return self._snapshot()[1]
+
+    def last_cycle_id(self) -> int:
+        """文件中最后一条记录的轮次 ID，空文件返回 0。"""
+        mm, count = self._snapshot()
+        return self._unpack(mm, count - 1).cycle_id if count else 0
+
+    def tail_rows(self, frames: int) -> List[HistoryRow]:
+        """读取最近 frames 轮的全部记录，按写入顺序排列。
+        :param
+            frames (int): 轮数。
+        :return
+            List[HistoryRow]: 记录列表。
+        """
+        mm, count = self._snapshot()
+        if not count or frames <= 0:
+            return []
+        rows = []
+        seen_cycles = 0
+        last_cycle = None
+        for index in range(count - 1, -1, -1):
+            row = self._unpack(mm, index)
+            if row.cycle_id != last_cycle:
+                seen_cycles += 1
+                if seen_cycles > frames:
+                    break
+                last_cycle = row.cycle_id
+            rows.append(row)
+        rows.reverse()
+        return rows
+
+    def build_index(self) -> int:
+        """将新增记录计入路段索引，返回已索引的记录数。可在后台线程中预先调用，避免首次深度查询时构建。"""
+        mm, total = self._snapshot()
+        with self._index_lock:
+            index = self._index
+            start = self._indexed
+            while start < total:
+                end = min(total, start + _INDEX_CHUNK_RECORDS)
+                chunk = mm[HEADER.size + start * RECORD.size:HEADER.size + end * RECORD.size]
+                for position, record in enumerate(RECORD.iter_unpack(chunk), start):
+                    positions = index.get(record[2])
+                    if positions is None:
+                        positions = index[record[2]] = array('q')
+                    positions.append(position)
+                start = end
+            self._indexed = start
+            return start
+
+    def tail_seconds(self, seconds: float) -> List[HistoryRow]:
+        """读取最后一条记录之前 seconds 秒内的全部记录，按写入顺序排列，通过二分查找定位起点。
+        :param
+            seconds (float): 时长(秒)。
+        :return
+            List[HistoryRow]: 记录列表。
+        """
+        mm, count = self._snapshot()
+        if not count or seconds <= 0:
+            return []
+        last_epoch = _EPOCH.unpack_from(mm, HEADER.size + (count - 1) * RECORD.size + _EPOCH_OFFSET)[0]
+        start = self._lower_bound(mm, 0, count, last_epoch - seconds)
+        return [self._unpack(mm, index) for index in range(start, count)]
+
+    def read_segment(self, seg_id: int, count: int) -> List[HistoryRow]:
+        """通过路段索引读取单个路段最近 count 条记录，按时间从旧到新排列，代价与 count 成正比。
+        :param
+            seg_id (int): 路段 ID。
+            count (int): 记录条数。
+        :return
+            List[HistoryRow]: 记录列表。
+        """
+        self.build_index()
+        mm, _total = self._snapshot()
+        with self._index_lock:
+            positions = self._index.get(seg_id)
+            if mm is None or not positions or count <= 0:
+                return []
+            # 索引可能比当前映射新（其他线程刚重新映射），只取映射范围内的记录
+            limit = (len(mm) - HEADER.size) // RECORD.size
+            selected = [p for p in positions[-count:] if p < limit]
+        return [self._unpack(mm, index) for index in selected]
+
+    @staticmethod
+    def _lower_bound(mm: mmap.mmap, lo: int, hi: int, epoch: float) -> int:
+        """在 [lo, hi) 中二分查找第一条 epoch >= 给定时间的记录下标。"""
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _EPOCH.unpack_from(mm, HEADER.size + mid * RECORD.size + _EPOCH_OFFSET)[0] < epoch:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read_range(self, seg_ids: Optional[Iterable[int]], start: float, end: float,
+                   step: float = 0, limit: int = 100000) -> Tuple[Dict[int, List[HistoryRow]], bool]:
+        """时间范围查询，返回 [start, end] 内指定路段的记录。
+        step>0 时按 step 秒分桶降采样，每个桶内每个路段只取第一条：
+        逐桶二分定位桶起点，只扫描桶开头的少量记录，代价与桶数而非原始记录数成正比。
+        :param
+            seg_ids (Optional[Iterable[int]]): 路段 ID 列表，None 表示全部路段。
+            start (float): 起始时间 (Unix 时间戳，含)。
+            end (float): 结束时间 (Unix 时间戳，含)。
+            step (float): 降采样间隔(秒)，<=0 表示返回全部记录。
+            limit (int): 返回记录总数上限。
+        :return
+            Tuple[Dict[int, List[HistoryRow]], bool]: (seg_id -> 记录(从旧到新), 是否因超出上限被截断)。
+        """
+        mm, total = self._snapshot()
+        result: Dict[int, List[HistoryRow]] = {}
+        if not total or end < start:
+            return result, False
+        wanted = set(seg_ids) if seg_ids is not None else None
+        lo = self._lower_bound(mm, 0, total, start)
+        hi = self._lower_bound(mm, lo, total, end + 1e-6)
+        returned = 0
+
+        def _take(index: int) -> bool:
+            nonlocal returned
+            if returned >= limit:
+                return False
+            row = self._unpack(mm, index)
+            result.setdefault(row.seg_id, []).append(row)
+            returned += 1
+            return True
+
+        if step <= 0:
+            for index in range(lo, hi):
+                seg_id = _SEG_ID.unpack_from(mm, HEADER.size + index * RECORD.size + _SEG_ID_OFFSET)[0]
+                if (wanted is None or seg_id in wanted) and not _take(index):
+                    return result, True
+            return result, False
+
+        bucket_start = start
+        index = lo
+        while index < hi:
+            bucket_end = bucket_start + step
+            taken = set()
+            while index < hi:
+                offset = HEADER.size + index * RECORD.size
+                if _EPOCH.unpack_from(mm, offset + _EPOCH_OFFSET)[0] >= bucket_end:
+                    break
+                seg_id = _SEG_ID.unpack_from(mm, offset + _SEG_ID_OFFSET)[0]
+                if (wanted is None or seg_id in wanted) and seg_id not in taken:
+                    if not _take(index):
+                        return result, True
+                    taken.add(seg_id)
+                    if wanted is not None and len(taken) == len(wanted):
+                        break
+                index += 1
+            # 跳到下一个桶：直接二分定位，跳过桶内剩余记录；没有数据的空桶整体跳过
+            index = self._lower_bound(mm, index, hi, bucket_end)
+            if index < hi:
+                next_epoch = _EPOCH.unpack_from(mm, HEADER.size + index * RECORD.size + _EPOCH_OFFSET)[0]
+                bucket_start = start + ((next_epoch - start) // step) * step
+        return result, False
+
@@ -0,0 +1,290 @@
+"""
+HistoryStore.py
+按路段索引的列式历史数据存储：每个路段维护一组定长环形列
+(轮次 ID、时间戳、拥堵等级、拥堵方向、车速)，内存占用只与路段数和历史深度有关，
+原始 JSON 只落盘、不驻留内存。读取单个路段时只需切片该路段的列，无需扫描全部历史。
+每轮数据追加时分配单调递增的轮次 ID (cycle id)，即当前数据代数，供增量查询使用。
+"""
+import time
+from array import array
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from globals import RoutineBMapData, g_data_lock, g_history_data
+from Metrics import g_metrics
+
+# HistoryRow.flags 标志位：车速沿用自上次路径规划结果
+FLAG_SPEED_CARRIED = 0x01
+
+# g_data_lock 等待时间，用于判断读写争用程度
+LOCK_WAIT = g_metrics.histogram("bmap_data_lock_wait_seconds", "g_data_lock 获取等待时间")
+
+
+class HistoryRow(NamedTuple):
+    """从列式存储中读出的一条历史记录。"""
+    cycle_id: int
+    epoch: float
+    seg_id: int
+    traffic_status: int
+    jam_direction: int
+    speed: float
+    flags: int = 0
+
+
+def result_flags(res) -> int:
+    """由 TrafficResult 计算记录标志位。"""
+    return FLAG_SPEED_CARRIED if res.speed_carried else 0
+
+
+class SinceResult(NamedTuple):
+    """增量读取结果。"""
+    cursor: int
+    history: Dict[int, List[HistoryRow]]
+    gap: bool     # 游标之后有轮次已移出内存，返回数据不完整
+    reset: bool   # 游标大于当前代数，已按全量返回
+
+
+class _SegmentColumns:
+    """单个路段的环形列存储，容量固定，写满后覆盖最旧的数据。"""
+
+    __slots__ = ("seg_id", "capacity", "head", "size", "cycle", "epoch", "status", "jam", "speed", "flags")
+
+    def __init__(self, seg_id: int, capacity: int):
+        self.seg_id = seg_id
+        self.capacity = capacity
+        self.head = 0   # 下一次写入的位置
+        self.size = 0   # 当前有效条目数
+        # 预分配全部容量：每条记录 8+8+1+1+4+1 = 23 字节
+        self.cycle = array('q', bytes(8 * capacity))
+        self.epoch = array('d', bytes(8 * capacity))
+        self.status = array('b', bytes(capacity))
+        self.jam = array('b', bytes(capacity))
+        self.speed = array('f', bytes(4 * capacity))
+        self.flags = array('B', bytes(capacity))
+
+    def append(self, cycle_id: int, epoch: float, status: int, jam: int, speed: float, flags: int = 0) -> int:
+        """追加一条记录，返回被覆盖的最旧记录的轮次 ID，未覆盖时返回 0。"""
+        i = self.head
+        evicted = self.cycle[i] if self.size == self.capacity else 0
+        self.cycle[i] = cycle_id
+        self.epoch[i] = epoch
+        self.status[i] = status
+        self.jam[i] = jam
+        self.speed[i] = speed
+        self.flags[i] = flags
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        return evicted
+
+    def row(self, k: int) -> HistoryRow:
+        """读取倒数第 k 条记录 (k=0 为最新)。"""
+        i = (self.head - 1 - k) % self.capacity
+        return HistoryRow(self.cycle[i], self.epoch[i], self.seg_id, self.status[i], self.jam[i], self.speed[i],
+                          self.flags[i])
+
+    def latest(self, count: int) -> List[HistoryRow]:
+        """读取最近 count 条记录，按时间从旧到新排列；count<=0 表示全部。"""
+        if count <= 0 or count > self.size:
+            count = self.size
+        return [self.row(k) for k in range(count - 1, -1, -1)]
+
+    def newer_than(self, since: int) -> List[HistoryRow]:
+        """读取轮次 ID 大于 since 的记录，从尾部向前遍历，遇到旧记录即停止。"""
+        count = 0
+        while count < self.size and self.cycle[(self.head - 1 - count) % self.capacity] > since:
+            count += 1
+        return self.latest(count) if count else []
+
+
+@contextmanager
+def _locked():
+    """获取 g_data_lock 并记录等待时间。"""
+    start = time.perf_counter()
+    g_data_lock.acquire()
+    LOCK_WAIT.observe(time.perf_counter() - start)
+    try:
+        yield
+    finally:
+        g_data_lock.release()
+
+
+class TrafficHistoryStore:
+    """以 seg_id 为键的分路段列式历史容器，与 g_history_data 共用 g_data_lock。"""
+
+    def __init__(self, max_frames: int = 20):
+        """初始化存储。
+        :param
+            max_frames (int): 每个路段保留的最大轮数。
+        :return
+            None
+        """
+        self.max_frames = max_frames
+        self._segments: Dict[int, _SegmentColumns] = {}
+        # 数据代数：每追加一轮加 1，供响应缓存判断数据是否变化
+        self._generation = 0
+        # 已从内存中移出（被覆盖或未预热载入）的最大轮次 ID，游标不大于它的增量查询可能缺失数据
+        self._evicted_through = 0
+        # 新一轮数据追加后的回调列表，回调参数为 (代数, 本轮记录)
+        self._listeners: List[Callable[[int, List[HistoryRow]], None]] = []
+
+    def add_listener(self, callback: Callable[[int, List[HistoryRow]], None]) -> None:
+        """注册新数据回调。回调在轮询线程中、锁外执行，应尽快返回。
+        :param
+            callback (Callable): 接收 (代数, 本轮记录) 的回调函数。
+        :return
+            None
+        """
+        self._listeners.append(callback)
+
+    @property
+    def generation(self) -> int:
+        """当前数据代数。"""
+        return self._generation
+
+    def resize(self, max_frames: int) -> None:
+        """调整每个路段保留的历史深度，已有数据保留最新的部分。
+        :param
+            max_frames (int): 新的历史深度。
+        :return
+            None
+        """
+        max_frames = max(1, max_frames)
+        with _locked():
+            if max_frames == self.max_frames:
+                return
+            for seg_id, old in list(self._segments.items()):
+                new = _SegmentColumns(seg_id, max_frames)
+                if old.size > max_frames:
+                    self._evicted_through = max(self._evicted_through, old.row(max_frames).cycle_id)
+                for row in old.latest(max_frames):
+                    new.append(row.cycle_id, row.epoch, row.traffic_status, row.jam_direction, row.speed, row.flags)
+                self._segments[seg_id] = new
+            self.max_frames = max_frames
+
+    def load_rows(self, rows: List[HistoryRow], last_cycle_id: int = 0) -> None:
+        """批量载入已持久化的历史记录（启动预热用），并将轮次 ID 续接到 last_cycle_id 之后。
+        不触发新数据回调，也不写入 g_history_data。
+        :param
+            rows (List[HistoryRow]): 按时间顺序排列的历史记录。
+            last_cycle_id (int): 持久化数据中最大的轮次 ID。
+        :return
+            None
+        """
+        with _locked():
+            for row in rows:
+                cols = self._segments.get(row.seg_id)
+                if cols is None:
+                    cols = self._segments[row.seg_id] = _SegmentColumns(row.seg_id, self.max_frames)
+                evicted = cols.append(row.cycle_id, row.epoch, row.traffic_status, row.jam_direction, row.speed,
+                                      row.flags)
+                self._evicted_through = max(self._evicted_through, evicted)
+            # 早于载入范围的轮次不在内存中
+            first_loaded = rows[0].cycle_id if rows else last_cycle_id + 1
+            self._evicted_through = max(self._evicted_through, first_loaded - 1)
+            self._generation = max(self._generation, last_cycle_id)
+
+    def append_frame(self, frame: RoutineBMapData, frame_time: Optional[float] = None) -> int:
+        """追加一轮数据：写入各路段的列存储，并将去掉原始 JSON 的副本放入全局历史容器。
+        :param
+            frame (RoutineBMapData): 本轮所有路段的查询结果。
+            frame_time (Optional[float]): 本轮开始时间 (Unix 时间戳)，默认取当前时间。
+        :return
+            int: 本轮分配到的轮次 ID。
+        """
+        if frame_time is None:
+            frame_time = time.time()
+        # 原始 JSON 已由写入线程落盘，内存中不再保留
+        light_frame = [replace(res, raw_json_traffic="", raw_json_route="") for res in frame]
+
+        with _locked():
+            self._generation += 1
+            generation = self._generation
+            g_history_data.append(light_frame)
+            rows = []
+            for res in frame:
+                cols = self._segments.get(res.seg_id)
+                if cols is None:
+                    cols = self._segments[res.seg_id] = _SegmentColumns(res.seg_id, self.max_frames)
+                evicted = cols.append(generation, frame_time, res.traffic_status, res.jam_direction, res.speed,
+                                      result_flags(res))
+                if evicted > self._evicted_through:
+                    self._evicted_through = evicted
+                rows.append(cols.row(0))
+
+        for callback in self._listeners:
+            try:
+                callback(generation, rows)
+            except Exception as e:
+                print(f"[Error] 历史数据回调执行失败: {e}")
+
+        return generation
+
+    def has_segment(self, seg_id: int) -> bool:
+        """内存中是否有该路段的数据。"""
+        with _locked():
+            return seg_id in self._segments
+
+    def read(self, seg_id: int, count: int = 0) -> List[HistoryRow]:
+        """读取单个路段最近 count 轮的数据，按时间从旧到新排列。
+        :param
+            seg_id (int): 路段 ID。
+            count (int): 读取轮数，<=0 表示读取全部。
+        :return
+            List[HistoryRow]: 该路段的历史记录，无数据时返回空列表。
+        """
+        with _locked():
+            cols = self._segments.get(seg_id)
+            return cols.latest(count) if cols else []
+
+    def read_segments(self, seg_ids: Iterable[int], count: int = 0) -> Dict[int, List[HistoryRow]]:
+        """一次加锁读取多个路段最近 count 轮的数据。
+        :param
+            seg_ids (Iterable[int]): 路段 ID。
+            count (int): 读取轮数，<=0 表示读取全部。
+        :return
+            Dict[int, List[HistoryRow]]: seg_id -> 该路段历史记录(从旧到新)，无数据的路段不返回。
+        """
+        with _locked():
+            return {seg_id: self._segments[seg_id].latest(count) for seg_id in seg_ids if seg_id in self._segments}
+
+    def read_all(self) -> Dict[int, List[HistoryRow]]:
+        """读取所有路段的全部历史数据。
+        :param
+            None
+        :return
+            Dict[int, List[HistoryRow]]: seg_id -> 该路段历史记录(从旧到新)。
+        """
+        with _locked():
+            return {seg_id: cols.latest(0) for seg_id, cols in self._segments.items()}
+
+    def read_since(self, seg_ids: Optional[Iterable[int]], since: int) -> SinceResult:
+        """增量读取：只返回轮次 ID 大于 since 的记录，代价只与新增记录数有关。
+        游标早于内存中仍保留的数据时 gap 为 True，表示部分轮次已被移出、返回的数据不完整；
+        游标大于当前代数（如服务重启且未恢复历史）时 reset 为 True，并按游标为 0 返回全部数据，客户端应重新同步。
+        :param
+            seg_ids (Optional[Iterable[int]]): 需要读取的路段 ID，None 表示全部路段。
+            since (int): 客户端持有的游标，即上次收到的轮次 ID。
+        :return
+            SinceResult: (新游标, seg_id -> 新增记录(从旧到新), gap, reset)。
+        """
+        result = {}
+        with _locked():
+            reset = since > self._generation
+            if reset:
+                since = 0
+            gap = since < self._evicted_through
+            targets = self._segments.keys() if seg_ids is None else seg_ids
+            for seg_id in targets:
+                cols = self._segments.get(seg_id)
+                if cols is None:
+                    continue
+                rows = cols.newer_than(since)
+                if rows:
+                    result[seg_id] = rows
+            return SinceResult(self._generation, result, gap, reset)
+
+
+# 全局分路段历史存储，默认深度与 g_history_data 一致，可通过 history_depth 配置加深
+g_history_store = TrafficHistoryStore(max_frames=g_history_data.maxlen)
@@ -0,0 +1,231 @@
+"""
+Metrics.py
+轻量级指标注册表：计数器、仪表和固定分桶的延迟直方图。
+热路径上只做一次加锁累加，快照和 Prometheus 文本格式在查询时才生成。
+通过 TCP 服务的 stats 动作查看，也可按轮导出为 Prometheus 文本文件。
+"""
+import os
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 默认延迟分桶上限(秒)，最后一个桶为 +Inf
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _series_name(name: str, labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Counter:
+    """单调递增计数器。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """可任意设置、增减的瞬时值。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+
+class Histogram:
+    """固定分桶直方图，记录次数、总和及各桶计数。"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def add_counts(self, counts: List[int], value_sum: float) -> None:
+        """合并其他进程中同一直方图的分桶计数增量。"""
+        with self._lock:
+            for index, n in enumerate(counts):
+                self.counts[index] += n
+            self.count += sum(counts)
+            self.sum += value_sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按分桶估算分位数，返回该分位所在桶的上限；落在 +Inf 桶时返回最大有限上限。"""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for index, n in enumerate(counts):
+            cumulative += n
+            if cumulative >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, value_sum = list(self.counts), self.count, self.sum
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return {
+            "count": total, "sum": round(value_sum, 6),
+            "avg": round(value_sum / total, 6) if total else None,
+            "p50": self.quantile(0.5), "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+
+class MetricsRegistry:
+    """指标注册表，按 (名称, 标签) 取得或创建指标。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Tuple[str, str, object]] = {}   # 序列名 -> (指标名, 类型, 指标对象)
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _get(self, kind: str, factory, name: str, help_text: str, labels: Optional[Dict[str, str]]):
+        series = _series_name(name, labels)
+        metric = self._metrics.get(series)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(series)
+                if metric is None:
+                    metric = self._metrics[series] = (name, kind, factory())
+                    self._help.setdefault(name, help_text)
+        return metric[2]
+
+    def counter(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get("counter", Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get("gauge", Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None,
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._get("histogram", lambda: Histogram(buckets), name, help_text, labels)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """注册采集回调，在生成快照前调用，用于把外部状态（如缓存命中数）同步到仪表。"""
+        self._collectors.append(collector)
+
+    def _collect(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"[Error] 指标采集失败: {e}")
+        with self._lock:
+            return sorted(self._metrics.items())
+
+    def cumulative(self) -> Dict[str, object]:
+        """计数器与直方图的当前累计值，用于跨进程汇总：计数器为数值，直方图为 (各桶计数, 总和)。"""
+        with self._lock:
+            items = list(self._metrics.items())
+        result = {}
+        for series, (_name, kind, metric) in items:
+            if kind == "counter":
+                result[series] = metric.value
+            elif kind == "histogram":
+                with metric._lock:
+                    result[series] = (list(metric.counts), metric.sum)
+        return result
+
+    @staticmethod
+    def delta(before: Dict[str, object], after: Dict[str, object]) -> Dict[str, object]:
+        """两次 cumulative 结果之差，只保留有变化的序列。"""
+        result = {}
+        for series, value in after.items():
+            old = before.get(series)
+            if isinstance(value, tuple):
+                old_counts, old_sum = old if old is not None else ([0] * len(value[0]), 0.0)
+                counts = [n - m for n, m in zip(value[0], old_counts)]
+                if any(counts):
+                    result[series] = (counts, value[1] - old_sum)
+            elif value != (old or 0):
+                result[series] = value - (old or 0)
+        return result
+
+    def merge(self, deltas: Dict[str, object]) -> None:
+        """将其他进程的 delta 结果累加到本注册表中同名的计数器与直方图，本进程未注册的序列忽略。"""
+        for series, value in deltas.items():
+            entry = self._metrics.get(series)
+            if entry is None:
+                continue
+            _name, kind, metric = entry
+            if kind == "counter":
+                metric.inc(value)
+            elif kind == "histogram" and len(value[0]) == len(metric.counts):
+                metric.add_counts(*value)
+
+    def snapshot(self) -> dict:
+        """以字典形式返回全部指标。"""
+        result = {"counters": {}, "gauges": {}, "histograms": {}}
+        for series, (_name, kind, metric) in self._collect():
+            if kind == "histogram":
+                result["histograms"][series] = metric.snapshot()
+            else:
+                result[kind + "s"][series] = metric.value
+        return result
+
+    def to_prometheus(self) -> str:
+        """以 Prometheus 文本格式导出全部指标。"""
+        lines = []
+        described = set()
+        for series, (name, kind, metric) in self._collect():
+            if name not in described:
+                described.add(name)
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+            if kind != "histogram":
+                lines.append(f"{series} {metric.value}")
+                continue
+            label_part = series[len(name):]
+            inner = label_part[1:-1] + "," if label_part else ""
+            for bound, cumulative in metric.snapshot()["buckets"].items():
+                lines.append(f'{name}_bucket{{{inner}le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{label_part} {metric.sum}")
+            lines.append(f"{name}_count{label_part} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump_prometheus(self, path: str) -> None:
+        """将 Prometheus 文本写入文件（先写临时文件再替换，避免读到半个文件）。"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+# 全局指标注册表
+g_metrics = MetricsRegistry()
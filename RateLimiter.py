@@ -0,0 +1,46 @@
+"""
+RateLimiter.py
+令牌桶限流器，用于多线程并发查询时控制对百度 API 的全局请求速率。
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器，所有查询线程共享同一个桶。"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """初始化令牌桶。
+        :param
+            rate (float): 每秒补充的令牌数，即允许的平均 QPS；<=0 表示不限流。
+            capacity (float): 桶容量，即允许的最大突发请求数，最小为 1。
+        :return
+            None
+        """
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """阻塞直到取得一个令牌。
+        :param
+            None
+        :return
+            None
+        """
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                # 计算还差多少时间才能攒够一个令牌，锁外等待
+                wait_seconds = (1.0 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
@@ -0,0 +1,180 @@
+"""
+RawArchive.py
+原始 JSON 归档：每轮所有路段的原始交通/路径规划响应打包为一个 gzip 块，
+按日期追加到 raw_YYYYMMDD.gz（多个 gzip 成员首尾相接，可直接用 zcat 查看），
+同时在 raw_index.bin 中追加一条 (轮次 ID, 日期, 偏移, 长度) 索引记录。
+索引按轮次 ID 递增写入，查询时二分定位后直接 seek 读取对应块，无需扫描归档文件。
+"""
+import gzip
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Optional
+
+from globals import RoutineBMapData
+
+MAGIC = b"BMAPRAWI"
+VERSION = 1
+HEADER = struct.Struct("<8sI20x")
+# cycle_id(q) 日期 YYYYMMDD(i) 块偏移(q) 块长度(i)
+INDEX_RECORD = struct.Struct("<qiqi")
+INDEX_FILENAME = "raw_index.bin"
+
+
+class TrafficRawArchive:
+    """原始 JSON 归档的读写封装。写入由单一写入线程调用，读取可在任意线程进行。"""
+
+    def __init__(self, directory: str, compress_level: int = 6):
+        """
+        :param
+            directory (str): 归档目录。
+            compress_level (int): gzip 压缩级别 (1-9)。
+        :return
+            None
+        """
+        self.directory = directory
+        self.compress_level = compress_level
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self._index_handle = None
+        self._block_handle = None
+        self._block_day = None
+        self._map_lock = threading.Lock()
+        self._map = None
+        self._map_size = 0
+
+    def _block_path(self, day: int) -> str:
+        return os.path.join(self.directory, f"raw_{day}.gz")
+
+    # ---------------- 写入 ----------------
+
+    def append_cycle(self, frame: RoutineBMapData, cycle_id: int, cycle_time: float) -> None:
+        """将一轮原始响应压缩为一个块追加到当日归档文件，并写入索引（不 flush）。
+        :param
+            frame (RoutineBMapData): 本轮所有路段的查询结果。
+            cycle_id (int): 本轮的轮次 ID。
+            cycle_time (float): 本轮开始时间 (Unix 时间戳)。
+        :return
+            None
+        """
+        if self._index_handle is None:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            handle = open(self.index_path, mode='ab')
+            if handle.tell() == 0:
+                handle.write(HEADER.pack(MAGIC, VERSION))
+            elif handle.tell() < HEADER.size or (handle.tell() - HEADER.size) % INDEX_RECORD.size:
+                # 上次写入中断留下半条索引记录，截断到整条记录边界
+                valid = max(HEADER.size, handle.tell() - (handle.tell() - HEADER.size) % INDEX_RECORD.size)
+                handle.truncate(valid)
+                handle.seek(valid)
+            self._index_handle = handle
+
+        day = int(time.strftime("%Y%m%d", time.localtime(cycle_time)))
+        if day != self._block_day:
+            if self._block_handle is not None:
+                self._block_handle.close()
+            self._block_handle = open(self._block_path(day), mode='ab')
+            self._block_day = day
+
+        block = json.dumps({
+            "cycle": cycle_id, "time": cycle_time,
+            "segments": {
+                str(res.seg_id): {"traffic": res.raw_json_traffic, "route": res.raw_json_route}
+                for res in frame
+            }
+        }, ensure_ascii=False).encode('utf-8')
+        data = gzip.compress(block, compresslevel=self.compress_level)
+
+        offset = self._block_handle.tell()
+        self._block_handle.write(data)
+        self._index_handle.write(INDEX_RECORD.pack(cycle_id, day, offset, len(data)))
+
+    def flush(self, fsync: bool = False) -> None:
+        # 先落归档块再落索引，保证索引指向的数据一定已写入
+        for handle in (self._block_handle, self._index_handle):
+            if handle is not None:
+                handle.flush()
+                if fsync:
+                    os.fsync(handle.fileno())
+
+    def close(self) -> None:
+        for handle in (self._block_handle, self._index_handle):
+            if handle is not None:
+                handle.close()
+        self._block_handle = self._index_handle = None
+        self._block_day = None
+        with self._map_lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+                self._map_size = 0
+
+    # ---------------- 读取 ----------------
+
+    def last_cycle_id(self) -> int:
+        """索引中最后一条完整记录的轮次 ID，索引不存在或为空时返回 0。
+        索引按轮次 ID 递增二分查找，启动时据此续接轮次 ID。"""
+        try:
+            with open(self.index_path, mode='rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                count = (size - HEADER.size) // INDEX_RECORD.size if size > HEADER.size else 0
+                if not count:
+                    return 0
+                f.seek(HEADER.size + (count - 1) * INDEX_RECORD.size)
+                return INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[0]
+        except OSError:
+            return 0
+
+    def _find(self, cycle_id: int):
+        """二分查找轮次 ID 对应的索引记录，返回 (日期, 偏移, 长度)，不存在返回 None。"""
+        with self._map_lock:
+            try:
+                size = os.path.getsize(self.index_path)
+            except OSError:
+                return None
+            if size <= HEADER.size:
+                return None
+            if self._map is None or size != self._map_size:
+                if self._map is not None:
+                    self._map.close()
+                with open(self.index_path, mode='rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._map_size = size
+            mm = self._map
+            lo, hi = 0, (size - HEADER.size) // INDEX_RECORD.size
+            while lo < hi:
+                mid = (lo + hi) // 2
+                record = INDEX_RECORD.unpack_from(mm, HEADER.size + mid * INDEX_RECORD.size)
+                if record[0] < cycle_id:
+                    lo = mid + 1
+                elif record[0] > cycle_id:
+                    hi = mid
+                else:
+                    return record[1:]
+        return None
+
+    def read(self, cycle_id: int, seg_id: int) -> Optional[dict]:
+        """读取指定轮次、路段的原始响应。
+        :param
+            cycle_id (int): 轮次 ID。
+            seg_id (int): 路段 ID。
+        :return
+            Optional[dict]: {"cycle", "time", "segID", "traffic", "route"}，不存在时返回 None。
+        """
+        location = self._find(cycle_id)
+        if location is None:
+            return None
+        day, offset, length = location
+        with open(self._block_path(day), mode='rb') as f:
+            f.seek(offset)
+            block = json.loads(gzip.decompress(f.read(length)))
+        payload = block["segments"].get(str(seg_id))
+        if payload is None:
+            return None
+        return {
+            "cycle": block["cycle"], "time": block["time"], "segID": seg_id,
+            "traffic": payload["traffic"], "route": payload["route"]
+        }
@@ -0,0 +1,74 @@
+"""
+Resilience.py
+路段级熔断器：路段连续多轮查询失败后暂停轮询，冷却期过后放行一次探测请求，
+探测成功则恢复，失败则继续熔断。熔断状态通过 TCP 服务的 breakers 动作查看。
+"""
+import threading
+import time
+from typing import Dict
+
+
+class CircuitBreaker:
+    """单个路段的熔断器，线程安全。"""
+
+    CLOSED = "closed"        # 正常轮询
+    OPEN = "open"            # 熔断中，跳过轮询
+    HALF_OPEN = "half_open"  # 冷却结束，正在探测
+
+    def __init__(self, seg_id: int, failure_threshold: int = 3, cooldown_seconds: float = 300.0):
+        """
+        :param
+            seg_id (int): 所属路段 ID，用于日志。
+            failure_threshold (int): 连续失败多少轮后熔断，<=0 表示永不熔断。
+            cooldown_seconds (float): 熔断后到下一次探测的间隔(秒)。
+        :return
+            None
+        """
+        self.seg_id = seg_id
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """本轮是否允许查询该路段。熔断冷却结束时放行一次探测。"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at >= self.cooldown_seconds:
+                    self.state = self.HALF_OPEN
+                    return True
+                self.skipped += 1
+                return False
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                    0 < self.failure_threshold <= self.consecutive_failures):
+                if self.state != self.OPEN:
+                    print(f"[Breaker] Seg {self.seg_id} 连续失败 {self.consecutive_failures} 轮，暂停轮询 {self.cooldown_seconds:.0f} 秒")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutiveFailures": self.consecutive_failures,
+                "skipped": self.skipped,
+                "retryAt": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.opened_at + self.cooldown_seconds))
+                if self.state == self.OPEN else None
+            }
+
+
+# 全局熔断器表 seg_id -> CircuitBreaker，由 TrafficManager 填充，供 TCP 服务查询
+g_circuit_breakers: Dict[int, CircuitBreaker] = {}
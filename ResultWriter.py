@@ -0,0 +1,146 @@
+"""
+ResultWriter.py
+后台持久化写入线程：轮询线程只负责把每轮数据放入队列，
+由写入线程保持文件句柄常开，按轮批量写入 CSV 结果、二进制历史文件、
+原始 JSON 压缩归档，以及可选的原始 JSON 文本日志。
+"""
+import csv
+import os
+import queue
+import threading
+from typing import Optional
+
+from globals import RoutineBMapData
+from HistoryFile import TrafficHistoryFile
+from HistoryStore import HistoryRow, result_flags
+from Metrics import g_metrics
+from RawArchive import TrafficRawArchive
+
+
+class TrafficResultWriter:
+    """按轮批量写入结果文件的后台写入器。"""
+
+    # 队列结束标记
+    _STOP = object()
+
+    def __init__(self, csv_filename: str, log_filename: Optional[str], fsync: bool = False,
+                 history_file: Optional[TrafficHistoryFile] = None,
+                 raw_archive: Optional[TrafficRawArchive] = None,
+                 metrics_dump_path: Optional[str] = None):
+        """初始化写入器并启动后台写入线程。
+        :param
+            csv_filename (str): CSV 结果文件路径。
+            log_filename (Optional[str]): 原始 JSON 文本日志路径，None 表示不写文本日志。
+            fsync (bool): 每轮写入后是否调用 os.fsync 落盘，默认只 flush。
+            history_file (Optional[TrafficHistoryFile]): 二进制历史文件，None 表示不写入。
+            raw_archive (Optional[TrafficRawArchive]): 原始 JSON 归档，None 表示不写入。
+            metrics_dump_path (Optional[str]): 每轮写完后导出 Prometheus 指标文本的路径，None 表示不导出。
+        :return
+            None
+        """
+        self.csv_filename = csv_filename
+        self.log_filename = log_filename
+        self.fsync = fsync
+        self.history_file = history_file
+        self.raw_archive = raw_archive
+        self.metrics_dump_path = metrics_dump_path
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="BMapWriter", daemon=True)
+        self._thread.start()
+
+    def submit_frame(self, frame: RoutineBMapData, cycle_id: int, cycle_time: float) -> None:
+        """提交一轮数据，立即返回，不等待磁盘 I/O。
+        :param
+            frame (RoutineBMapData): 本轮所有路段的查询结果。
+            cycle_id (int): 本轮的轮次 ID。
+            cycle_time (float): 本轮开始时间 (Unix 时间戳)。
+        :return
+            None
+        """
+        self._queue.put_nowait((frame, cycle_id, cycle_time))
+
+    def close(self, timeout: float = None) -> None:
+        """写完队列中剩余数据后关闭文件并结束写入线程。
+        :param
+            timeout (float): 等待写入线程结束的最长时间，None 表示一直等待。
+        :return
+            None
+        """
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def _open_files(self):
+        """以追加模式打开结果文件，新文件先写入 CSV 表头。"""
+        is_new_csv = not os.path.exists(self.csv_filename)
+        csv_file = open(self.csv_filename, mode='a', newline='', encoding='utf-8')
+        if is_new_csv:
+            csv.writer(csv_file).writerow(["Time", "SegID", "TrafficStatus", "JamDirection", "Speed(km/h)", "SpeedCarried"])
+            csv_file.flush()
+        log_file = open(self.log_filename, mode='a', encoding='utf-8') if self.log_filename else None
+        return csv_file, log_file
+
+    def _write_frame(self, csv_file, log_file, frame: RoutineBMapData, cycle_id: int, cycle_time: float) -> None:
+        """将一轮数据整体写入各文件，文本文件末尾追加空行作为轮次分隔。"""
+        writer = csv.writer(csv_file)
+        writer.writerows([
+            [res.timestamp, res.seg_id, res.traffic_status, res.jam_direction, f"{res.speed:.2f}", int(res.speed_carried)]
+            for res in frame
+        ])
+        writer.writerow([])
+
+        files = [csv_file]
+        if log_file is not None:
+            lines = []
+            for res in frame:
+                lines.append(f"[{res.timestamp}] [ID:{res.seg_id}] TRAFFIC: {res.raw_json_traffic}\n")
+                lines.append(f"[{res.timestamp}] [ID:{res.seg_id}] ROUTE:   {res.raw_json_route}\n")
+            lines.append("\n")
+            log_file.writelines(lines)
+            files.append(log_file)
+
+        for f in files:
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+        if self.raw_archive is not None:
+            self.raw_archive.append_cycle(frame, cycle_id, cycle_time)
+            self.raw_archive.flush(self.fsync)
+
+        if self.history_file is not None:
+            self.history_file.append_rows([
+                HistoryRow(cycle_id, cycle_time, res.seg_id, res.traffic_status, res.jam_direction, res.speed,
+                           result_flags(res))
+                for res in frame
+            ])
+            self.history_file.flush(self.fsync)
+
+        if self.metrics_dump_path:
+            g_metrics.dump_prometheus(self.metrics_dump_path)
+
+    def _run(self) -> None:
+        """写入线程主循环。"""
+        try:
+            csv_file, log_file = self._open_files()
+        except Exception as e:
+            print(f"[Error] 打开结果文件失败: {e}")
+            return
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._STOP:
+                    break
+                try:
+                    self._write_frame(csv_file, log_file, *item)
+                except Exception as e:
+                    print(f"[Error] 文件写入失败: {e}")
+        finally:
+            csv_file.close()
+            if log_file is not None:
+                log_file.close()
+            if self.history_file is not None:
+                self.history_file.close()
+            if self.raw_archive is not None:
+                self.raw_archive.close()
@@ -0,0 +1,265 @@
+"""
+Sharding.py
+多进程分片轮询：将路段按交通态势 URL 分组后均衡分配给 N 个工作进程，
+每个进程独立完成请求与解析，只回传紧凑的结果元组（原始 JSON 经 zlib 压缩，未配置归档时不回传），
+主进程合并为一帧写入历史。熔断判断与记录仍在主进程中进行，TCP 服务看到的熔断状态不受影响。
+工作进程每批回传计数器与直方图的增量，由主进程合并到 g_metrics。
+每个进程分得 qps_limit / N 的请求速率和 fetch_workers / N 的查询线程。
+分片进程退出或超时未响应时，本轮按请求失败处理并重新启动该分片进程。
+"""
+import math
+import multiprocessing
+import threading
+import time
+import zlib
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+
+from BMap import BREAKER_SKIPPED, TrafficManager
+from globals import RoadSegment, RoutineBMapData, TrafficResult, TrafficTaskConfig
+from Metrics import MetricsRegistry, g_metrics
+from Resilience import CircuitBreaker
+
+# 回传结果元组：(seg_id, 拥堵等级, 拥堵方向, 车速, 车速是否沿用, 压缩后的交通态势 JSON, 压缩后的路径规划 JSON)
+PackedResult = Tuple[int, int, int, float, bool, bytes, bytes]
+
+
+def pack_result(res: TrafficResult, keep_raw: bool) -> PackedResult:
+    return (
+        res.seg_id, res.traffic_status, res.jam_direction, res.speed, res.speed_carried,
+        zlib.compress(res.raw_json_traffic.encode('utf-8'), 1) if keep_raw else b"",
+        zlib.compress(res.raw_json_route.encode('utf-8'), 1) if keep_raw else b""
+    )
+
+
+def unpack_result(packed: PackedResult, now_str: str) -> TrafficResult:
+    seg_id, status, jam, speed, carried, raw_traffic, raw_route = packed
+    return TrafficResult(
+        seg_id=seg_id, timestamp=now_str,
+        traffic_status=status, jam_direction=jam, speed=speed,
+        raw_json_traffic=zlib.decompress(raw_traffic).decode('utf-8') if raw_traffic else "{}",
+        raw_json_route=zlib.decompress(raw_route).decode('utf-8') if raw_route else "{}",
+        speed_carried=carried
+    )
+
+
+class ShardFetcher(TrafficManager):
+    """工作进程内的查询器：只负责请求与解析，不加载配置文件、不写历史和结果文件。"""
+
+    def __init__(self, task_config: TrafficTaskConfig, segments: List[RoadSegment]):
+        """
+        :param
+            task_config (TrafficTaskConfig): 已按分片数调整过限流与线程数的任务配置。
+            segments (List[RoadSegment]): 本分片负责的路段。
+        :return
+            None
+        """
+        self.segments = segments
+        self.init_fetching(task_config)
+        self.shard_pool = None
+        # 熔断由主进程负责，分片内的熔断器永不熔断
+        self.breakers = {seg.id: CircuitBreaker(seg.id, failure_threshold=0) for seg in segments}
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.session.close()
+
+
+def _shard_worker(conn, task_config: TrafficTaskConfig, segments: List[RoadSegment], keep_raw: bool) -> None:
+    """工作进程入口：循环接收 (路段序号列表, 时间戳字符串)，返回 (结果元组列表, 解析耗时, 解析次数, 指标增量)；
+    收到 None 时退出。"""
+    fetcher = ShardFetcher(task_config, segments)
+    baseline = g_metrics.cumulative()
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            indexes, now_str = message
+            deadline = fetcher.begin_cycle()
+            results = fetcher.query_segments([segments[i] for i in indexes], now_str, deadline)
+            with fetcher._parse_lock:
+                parse_seconds, parse_count = fetcher._parse_seconds, fetcher._parse_count
+            current = g_metrics.cumulative()
+            deltas = MetricsRegistry.delta(baseline, current)
+            baseline = current
+            conn.send(([pack_result(res, keep_raw) for res in results], parse_seconds, parse_count, deltas))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        fetcher.close()
+        conn.close()
+
+
+class ShardedPoller:
+    """主进程侧的分片调度：按分片分发路段、合并结果并维护熔断状态。"""
+
+    def __init__(self, manager: TrafficManager, task_config: TrafficTaskConfig, processes: int):
+        """
+        :param
+            manager (TrafficManager): 主进程中的管理器，提供路段列表、熔断器和解析耗时统计。
+            task_config (TrafficTaskConfig): 任务配置。
+            processes (int): 工作进程数。
+        :return
+            None
+        """
+        self.manager = manager
+        self.keep_raw = bool(task_config.raw_archive_dir or task_config.raw_text_log)
+        shards = self.partition(manager.segments, processes)
+        shard_config = replace(
+            task_config,
+            qps_limit=task_config.qps_limit / len(shards) if task_config.qps_limit > 0 else task_config.qps_limit,
+            fetch_workers=max(1, math.ceil(task_config.fetch_workers / len(shards))),
+            http_pool_size=math.ceil(task_config.http_pool_size / len(shards)) if task_config.http_pool_size > 0 else 0
+        )
+
+        self._shards = shards
+        self._shard_config = shard_config
+        # 等待分片回传结果的超时：一轮的重试时限（或轮询间隔）加一次请求的连接与读取超时
+        policy = task_config.retry_policy
+        self.recv_timeout = max(task_config.interval_seconds, policy.cycle_deadline) + \
+            task_config.connect_timeout + task_config.read_timeout
+        # seg_id -> (分片序号, 分片内序号)
+        self._locate: Dict[int, Tuple[int, int]] = {}
+        for shard_no, segs in enumerate(shards):
+            for index, seg in enumerate(segs):
+                self._locate[seg.id] = (shard_no, index)
+        # 使用 spawn 启动，避免 fork 复制主进程中的线程与锁
+        self._context = multiprocessing.get_context("spawn")
+        self._conns = [None] * len(shards)
+        self._processes = [None] * len(shards)
+        for shard_no in range(len(shards)):
+            self._start_shard(shard_no)
+        self._lock = threading.Lock()
+        print(f"分片轮询: {len(shards)} 个进程，各分片路段数 {[len(segs) for segs in shards]}")
+
+    def _start_shard(self, shard_no: int) -> None:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_shard_worker, args=(child_conn, self._shard_config, self._shards[shard_no], self.keep_raw),
+            name=f"BMapShard-{shard_no}", daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._conns[shard_no] = parent_conn
+        self._processes[shard_no] = process
+
+    def _restart_shard(self, shard_no: int) -> None:
+        """结束异常的分片进程并重新启动，丢弃旧管道中可能迟到的结果。"""
+        process = self._processes[shard_no]
+        if process.is_alive():
+            process.terminate()
+        process.join(1.0)
+        self._conns[shard_no].close()
+        self._start_shard(shard_no)
+        print(f"[Warning] 分片 {shard_no} 已重新启动")
+
+    @staticmethod
+    def partition(segments: List[RoadSegment], processes: int) -> List[List[RoadSegment]]:
+        """按交通态势 URL 分组后，从大到小依次分给当前路段最少的分片，共用 URL 的路段留在同一分片以保持请求去重。
+        :param
+            segments (List[RoadSegment]): 全部路段。
+            processes (int): 分片数。
+        :return
+            List[List[RoadSegment]]: 各分片的路段，分片内保持原有顺序；空分片会被去掉。
+        """
+        groups: Dict[str, List[int]] = {}
+        for index, seg in enumerate(segments):
+            groups.setdefault(seg.traffic_url, []).append(index)
+        buckets: List[List[int]] = [[] for _ in range(max(1, processes))]
+        for indexes in sorted(groups.values(), key=len, reverse=True):
+            min(buckets, key=len).extend(indexes)
+        return [[segments[i] for i in sorted(bucket)] for bucket in buckets if bucket]
+
+    def query_segments(self, segs: List[RoadSegment], now_str: str,
+                       deadline: Optional[float] = None) -> RoutineBMapData:
+        """将路段分发给各分片并行查询，按 segs 的顺序合并结果。
+        :param
+            segs (List[RoadSegment]): 要查询的路段。
+            now_str (str): 本轮轮询的时间戳字符串。
+            deadline (Optional[float]): 与 TrafficManager.query_segments 保持一致，重试截止时间由各分片进程自行计算。
+        :return
+            RoutineBMapData: 各路段本轮的查询结果。
+        """
+        breakers = self.manager.breakers
+        requests: Dict[int, List[int]] = {}
+        allowed_ids = set()
+        for seg in segs:
+            if breakers[seg.id].allow():
+                allowed_ids.add(seg.id)
+                shard_no, index = self._locate[seg.id]
+                requests.setdefault(shard_no, []).append(index)
+            else:
+                BREAKER_SKIPPED.inc()
+
+        merged: Dict[int, TrafficResult] = {}
+        with self._lock:
+            # 先全部发送再依次接收，各分片并行工作；已退出的分片先重新启动
+            sent = []
+            failed = []
+            for shard_no, indexes in requests.items():
+                if not self._processes[shard_no].is_alive():
+                    self._restart_shard(shard_no)
+                try:
+                    self._conns[shard_no].send((indexes, now_str))
+                    sent.append(shard_no)
+                except (BrokenPipeError, OSError) as e:
+                    print(f"[Error] 分片 {shard_no} 发送失败: {e}")
+                    failed.append(shard_no)
+            deadline = time.monotonic() + self.recv_timeout
+            for shard_no in sent:
+                conn = self._conns[shard_no]
+                try:
+                    if not conn.poll(max(0.0, deadline - time.monotonic())):
+                        raise TimeoutError(f"{self.recv_timeout:.0f} 秒内未返回结果")
+                    packed_results, parse_seconds, parse_count, deltas = conn.recv()
+                except (EOFError, OSError) as e:
+                    print(f"[Error] 分片 {shard_no} 无响应: {e}")
+                    failed.append(shard_no)
+                    continue
+                self.manager.record_parse_time(parse_seconds, parse_count)
+                g_metrics.merge(deltas)
+                for packed in packed_results:
+                    merged[packed[0]] = unpack_result(packed, now_str)
+            for shard_no in failed:
+                self._restart_shard(shard_no)
+
+        results = []
+        for seg in segs:
+            res = merged.get(seg.id)
+            if res is None:
+                # 熔断中的路段以 -3 标记；分片进程异常时按请求失败以 -2 标记
+                skipped = seg.id not in allowed_ids
+                code = -3 if skipped else -2
+                res = TrafficResult(
+                    seg_id=seg.id, timestamp=now_str,
+                    traffic_status=code, jam_direction=code, speed=float(code),
+                    raw_json_traffic="{}", raw_json_route="{}"
+                )
+                if not skipped:
+                    breakers[seg.id].record_failure()
+            elif res.traffic_status == -2 or res.speed == -2.0:
+                breakers[seg.id].record_failure()
+            else:
+                breakers[seg.id].record_success()
+            results.append(res)
+        return results
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """通知各分片进程退出并等待结束。"""
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        deadline = time.monotonic() + (timeout or 0)
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()) if timeout else None)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._conns = []
+        self._processes = []
@@ -1,10 +1,21 @@
+import asyncio
 import socketserver
 import json
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
 from TimeSchedule import TrafficTaskConfig
 
 # 引入全局变量
-from globals import g_history_data, g_data_lock, TrafficResult
+from Aggregates import g_aggregates
+from HistoryFile import TrafficHistoryFile
+from HistoryStore import FLAG_SPEED_CARRIED, HistoryRow, g_history_store
+from RawArchive import TrafficRawArchive
+from Metrics import g_metrics
+from Resilience import CircuitBreaker, g_circuit_breakers
+from SpatialIndex import g_spatial_index
 
 
 class JsonResponse:
@@ -24,40 +35,372 @@ class JsonResponse:
             "data": data
         }, ensure_ascii=False)
 
+    @staticmethod
+    def make_raw(success, msg, raw_data: bytes) -> bytes:
+        """
+        使用已编码的数据段拼接响应，避免对缓存数据重复编码。
+        :param success: 响应码
+        :param msg: 附带的信息
+        :param raw_data: 已编码为 UTF-8 JSON 的数据段
+        :return: 生成的响应字节
+        """
+        head = json.dumps({
+            "code": 200 if success else 400,
+            "success": success,
+            "message": msg
+        }, ensure_ascii=False)
+        return head[:-1].encode('utf-8') + b', "data": ' + raw_data + b'}'
+
 
 class TrafficDataAccess:
-    """数据访问：安全读取全局变量 g_history_data"""
+    """数据访问：通过分路段历史存储 g_history_store 安全读取历史数据，
+    超出内存历史深度的 read 请求由持久化历史文件提供"""
 
-    def _fmt(self, res: TrafficResult):
+    def __init__(self):
+        self.history_file: Optional[TrafficHistoryFile] = None
+        self.raw_archive: Optional[TrafficRawArchive] = None
+
+    def _fmt(self, row: HistoryRow, time_format: str = "%H:%M:%S"):
         return {
-            "time": res.timestamp, "segID": res.seg_id,
-            "trafficStatus": res.traffic_status, "jamDirection": res.jam_direction,
-            "speed": res.speed
+            "time": time.strftime(time_format, time.localtime(row.epoch)), "segID": row.seg_id,
+            "trafficStatus": row.traffic_status, "jamDirection": row.jam_direction,
+            "speed": round(row.speed, 2), "speedCarried": bool(row.flags & FLAG_SPEED_CARRIED),
+            "cycle": row.cycle_id
+        }
+
+    def _fmt_history(self, history: dict, time_format: str = "%H:%M:%S") -> dict:
+        return {
+            f"seg_{sid:02d}": [self._fmt(row, time_format) for row in rows]
+            for sid, rows in history.items() if rows
         }
 
     def get_data(self, seg_id=0, count=0, read_all=False):
-        res_dict = {}
-        with g_data_lock:
-            # 拷贝数据快照
-            snapshot = list(g_history_data)
+        if read_all:
+            history = g_history_store.read_all()
+        elif count > g_history_store.max_frames and self.history_file is not None:
+            # 未知路段直接返回空结果，不读取历史文件；单次最多返回 MAX_READ_ROWS 条
+            count = min(count, MAX_READ_ROWS)
+            rows = self.history_file.read_segment(seg_id, count) if g_history_store.has_segment(seg_id) else []
+            history = {seg_id: rows}
+        else:
+            # 只切片目标路段的缓冲区，count<=0 时返回该路段全部历史
+            history = {seg_id: g_history_store.read(seg_id, count)}
+        return self._fmt_history(history)
+
+    def get_data_since(self, since, seg_id=0, read_all=False):
+        """增量查询：返回轮次 ID 大于 since 的数据以及新游标；gap / reset 标记数据缺失或游标失效"""
+        cursor, history, gap, reset = g_history_store.read_since(None if read_all else [seg_id], since)
+        return {"cursor": cursor, "frames": self._fmt_history(history), "gap": gap, "reset": reset}
 
-        # 如果不是 read_all，则只取最近 count 条
-        if not read_all and count > 0:
-            snapshot = snapshot[-count:]
+    def history_file_current(self) -> bool:
+        """持久化历史文件是否已写到内存中的最新一轮，写入线程落后时深度查询结果不完整。"""
+        return self.history_file is not None and self.history_file.last_cycle_id() >= g_history_store.generation
 
-        for frame in snapshot:
-            for seg_res in frame:
-                # 如果是 read_all 或者 ID 匹配
-                if read_all or seg_res.seg_id == seg_id:
-                    key = f"seg_{seg_res.seg_id:02d}"
-                    if key not in res_dict: res_dict[key] = []
-                    res_dict[key].append(self._fmt(seg_res))
-        return res_dict
+    def get_range(self, seg_ids, start, end, step=0):
+        """时间范围查询：从持久化历史文件二分定位，时间字段带日期"""
+        if self.history_file is None:
+            raise ValueError("未配置持久化历史文件，无法进行范围查询")
+        history, truncated = self.history_file.read_range(seg_ids, start, end, step, MAX_RANGE_ROWS)
+        return {"truncated": truncated, "frames": self._fmt_history(history, "%Y-%m-%d %H:%M:%S")}
 
 
+# range 动作单次返回的最大记录数
+MAX_RANGE_ROWS = 100000
+# read 动作 hisTime 超出内存深度、读取历史文件时单个路段最多返回的记录数，更早的数据用 range 查询
+MAX_READ_ROWS = 10000
+
 db = TrafficDataAccess()
 
 
+class ResponseCache:
+    """按数据代数缓存已编码的响应字节，数据每轮更新一次，同一请求每轮只编码一次。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 按请求键的构建锁，只串行化相同请求的构建；随代数变化整体清空
+        self._build_locks: Dict[tuple, threading.Lock] = {}
+        self._locks_generation = -1
+        self._generation = -1
+        self._entries: Dict[tuple, bytes] = {}
+        self.max_entries = 4096
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, key: tuple) -> Optional[bytes]:
+        """只查询当前代数的缓存，不构建。"""
+        return self._lookup(key, g_history_store.generation)
+
+    def _lookup(self, key, generation):
+        with self._lock:
+            payload = self._entries.get(key) if self._generation == generation else None
+            if payload is not None:
+                self.hits += 1
+            return payload
+
+    def get(self, key: tuple, builder: Callable[[], bytes], cacheable: bool = True) -> bytes:
+        """
+        读取缓存，未命中时调用 builder 生成并按当前代数缓存。
+        :param key: 请求键，如 ("read", segID, hisTime)
+        :param builder: 生成响应字节的函数
+        :param cacheable: 为 False 时生成的响应不写入缓存（数据源尚未完整）
+        :return: 已编码的响应字节
+        """
+        generation = g_history_store.generation
+        payload = self._lookup(key, generation)
+        if payload is not None:
+            return payload
+
+        # 按请求键串行化构建，并发的相同请求只有第一个真正编码，不同请求互不等待
+        with self._lock:
+            if generation > self._locks_generation:
+                self._build_locks = {}
+                self._locks_generation = generation
+            build_lock = self._build_locks.get(key) if generation == self._locks_generation else None
+            if build_lock is None:
+                build_lock = threading.Lock()
+                # 与缓存条目相同的上限；超出上限或代数已过期时不共享构建锁，直接各自构建
+                if generation == self._locks_generation and len(self._build_locks) < self.max_entries:
+                    self._build_locks[key] = build_lock
+        with build_lock:
+            generation = g_history_store.generation
+            payload = self._lookup(key, generation)
+            if payload is not None:
+                return payload
+
+            payload = builder()
+            with self._lock:
+                self.misses += 1
+                # 构建期间数据未更新才写入缓存；代数变化时整体淘汰旧条目
+                if cacheable and g_history_store.generation == generation:
+                    if self._generation != generation:
+                        self._entries = {}
+                        self._generation = generation
+                    # 游标参数取值较分散，条目数设上限，防止单代缓存无限增长
+                    if len(self._entries) < self.max_entries:
+                        self._entries[key] = payload
+        return payload
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "generation": self._generation, "entries": len(self._entries),
+                "hits": self.hits, "misses": self.misses
+            }
+
+
+response_cache = ResponseCache()
+
+
+def read_request(seg_id: int, count: int, since: Optional[int] = None) -> Tuple[tuple, Callable[[], bytes]]:
+    """read 动作的缓存键与响应构建函数；hisTime<=0 与等于内存历史深度等价，归一化后共用缓存。"""
+    if since is not None:
+        return ("read", seg_id, since), \
+            lambda: JsonResponse.make(True, "OK", db.get_data_since(since, seg_id=seg_id)).encode('utf-8')
+    if count <= 0 or count == g_history_store.max_frames:
+        count = 0
+    elif count > g_history_store.max_frames and db.history_file is None:
+        count = 0
+    elif count > MAX_READ_ROWS:
+        count = max(MAX_READ_ROWS, g_history_store.max_frames)
+    return ("read", seg_id, count), \
+        lambda: JsonResponse.make(True, "OK", db.get_data(seg_id=seg_id, count=count)).encode('utf-8')
+
+
+def readall_request(since: Optional[int] = None) -> Tuple[tuple, Callable[[], bytes]]:
+    """readall 动作的缓存键与响应构建函数。"""
+    if since is not None:
+        return ("readall", since), \
+            lambda: JsonResponse.make(True, "OK", db.get_data_since(since, read_all=True)).encode('utf-8')
+    return ("readall",), lambda: JsonResponse.make(True, "OK", db.get_data(read_all=True)).encode('utf-8')
+
+
+def cached_read(seg_id: int, count: int, since: Optional[int] = None) -> bytes:
+    """read 动作的缓存响应；深度查询只在历史文件已写到当前轮次后才缓存。"""
+    key, builder = read_request(seg_id, count, since)
+    deep = since is None and key[2] > g_history_store.max_frames
+    return response_cache.get(key, builder, cacheable=not deep or db.history_file_current())
+
+
+def cached_readall(since: Optional[int] = None) -> bytes:
+    """readall 动作的缓存响应。"""
+    return response_cache.get(*readall_request(since))
+
+
+def probe_cache(req: dict) -> Optional[bytes]:
+    """只查缓存：请求为 read / readall 且当前代数已有缓存时返回响应，否则返回 None（不构建、不阻塞）。"""
+    action = req.get('action')
+    try:
+        since = int(req['since']) if req.get('since') is not None else None
+        if action == 'read':
+            key, _builder = read_request(int(req.get('segID', 0)), int(req.get('hisTime', 1)), since)
+        elif action == 'readall':
+            key, _builder = readall_request(since)
+        else:
+            return None
+    except (TypeError, ValueError):
+        return None
+    return response_cache.peek(key)
+
+
+# 已知动作，指标按动作分类统计，未知动作统一归为 unknown
+KNOWN_ACTIONS = ("read", "readall", "range", "raw", "aggregate", "bbox", "near", "batch", "subscribe", "unsubscribe",
+                 "breakers", "cachestats", "stats")
+
+TCP_REQUESTS = {action: g_metrics.counter("bmap_tcp_requests_total", "TCP 请求数", {"action": action})
+                for action in KNOWN_ACTIONS + ("unknown",)}
+TCP_LATENCY = {mode: g_metrics.histogram("bmap_tcp_request_seconds", "TCP 请求处理耗时", {"mode": mode})
+               for mode in ("thread", "asyncio")}
+TCP_CONNECTIONS = {mode: g_metrics.gauge("bmap_tcp_connections", "当前 TCP 连接数", {"mode": mode})
+                   for mode in ("thread", "asyncio")}
+TCP_SUBSCRIBERS = g_metrics.gauge("bmap_tcp_subscribers", "当前订阅推送的连接数")
+CACHE_HITS = g_metrics.gauge("bmap_response_cache_hits", "响应缓存命中次数")
+CACHE_MISSES = g_metrics.gauge("bmap_response_cache_misses", "响应缓存未命中次数")
+BREAKERS_OPEN = g_metrics.gauge("bmap_breakers_open", "处于熔断状态的路段数")
+
+
+def _collect_server_metrics() -> None:
+    CACHE_HITS.set(response_cache.hits)
+    CACHE_MISSES.set(response_cache.misses)
+    BREAKERS_OPEN.set(sum(1 for b in g_circuit_breakers.values() if b.state != CircuitBreaker.CLOSED))
+
+
+g_metrics.add_collector(_collect_server_metrics)
+
+
+def count_request(req) -> None:
+    action = req.get('action') if isinstance(req, dict) else None
+    TCP_REQUESTS[action if action in KNOWN_ACTIONS else "unknown"].inc()
+
+
+# near 动作 k 的上限
+MAX_NEAR_RESULTS = 1000
+
+# batch 动作单次允许的最大子请求数
+MAX_BATCH_SIZE = 256
+
+
+def parse_request_time(value) -> float:
+    """解析请求中的时间参数，支持 "YYYY-MM-DD HH:MM:SS" 字符串或 Unix 时间戳。"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def dispatch_request(req: dict) -> bytes:
+    """
+    执行单个请求并返回已编码的响应字节，线程模式与 asyncio 模式共用。
+    :param req: 已解析的请求对象
+    :return: 响应字节（不含换行分隔符）
+    """
+    action = req.get('action')
+
+    # since 为客户端游标，携带时只返回比游标新的轮次
+    since = req.get('since')
+    if since is not None:
+        since = int(since)
+
+    if action == 'read':
+        seg_id = int(req.get('segID', 0))
+        count = int(req.get('hisTime', 1))
+        return cached_read(seg_id, count, since)
+
+    elif action == 'readall':
+        return cached_readall(since)
+
+    elif action == 'range':
+        seg_ids = req.get('segIDs')
+        data = db.get_range(
+            [int(i) for i in seg_ids] if seg_ids else None,
+            parse_request_time(req['start']), parse_request_time(req['end']),
+            float(req.get('step', 0))
+        )
+        return JsonResponse.make(True, "OK", data).encode('utf-8')
+
+    elif action == 'raw':
+        if db.raw_archive is None:
+            raise ValueError("未配置原始 JSON 归档，无法读取原始数据")
+        data = db.raw_archive.read(int(req['cycle']), int(req['segID']))
+        if data is None:
+            return JsonResponse.make(False, "Raw payload not found").encode('utf-8')
+        return JsonResponse.make(True, "OK", data).encode('utf-8')
+
+    elif action == 'aggregate':
+        # 滚动窗口聚合：segID / segIDs 指定路段（缺省为全部），window 指定窗口长度(秒)（缺省为全部窗口）
+        if req.get('segIDs'):
+            seg_ids = [int(i) for i in req['segIDs']]
+        elif req.get('segID'):
+            seg_ids = [int(req['segID'])]
+        else:
+            seg_ids = None
+        window = req.get('window')
+        aggregates = g_aggregates.read(seg_ids, int(window) if window is not None else None)
+        data = {f"seg_{seg_id:02d}": windows for seg_id, windows in aggregates.items()}
+        return JsonResponse.make(True, "OK", data).encode('utf-8')
+
+    elif action == 'bbox':
+        # 视口查询：返回与矩形相交的路段最近 hisTime 轮数据
+        seg_ids = g_spatial_index.bbox(float(req['minLat']), float(req['minLon']),
+                                       float(req['maxLat']), float(req['maxLon']))
+        history = g_history_store.read_segments(seg_ids, int(req.get('hisTime', 1)))
+        return JsonResponse.make(True, "OK", db._fmt_history(history)).encode('utf-8')
+
+    elif action == 'near':
+        # 邻近查询：radius(米) 与 k 至少给出一个，结果按距离从近到远排列
+        radius = req.get('radius')
+        k = req.get('k')
+        nearest = g_spatial_index.near(float(req['lat']), float(req['lon']),
+                                       float(radius) if radius is not None else None,
+                                       min(int(k), MAX_NEAR_RESULTS) if k is not None else None)
+        history = g_history_store.read_segments([seg_id for seg_id, _ in nearest], int(req.get('hisTime', 1)))
+        data = [
+            {"segID": seg_id, "distance": round(distance, 1),
+             "history": [db._fmt(row) for row in history.get(seg_id, [])]}
+            for seg_id, distance in nearest
+        ]
+        return JsonResponse.make(True, "OK", data).encode('utf-8')
+
+    elif action == 'breakers':
+        data = {f"seg_{seg_id:02d}": breaker.snapshot() for seg_id, breaker in g_circuit_breakers.items()}
+        return JsonResponse.make(True, "OK", data).encode('utf-8')
+
+    elif action == 'stats':
+        # format=prometheus 时返回 Prometheus 文本，否则返回 JSON 快照
+        if req.get('format') == 'prometheus':
+            return JsonResponse.make(True, "OK", g_metrics.to_prometheus()).encode('utf-8')
+        return JsonResponse.make(True, "OK", g_metrics.snapshot()).encode('utf-8')
+
+    elif action == 'cachestats':
+        return JsonResponse.make(True, "OK", response_cache.stats()).encode('utf-8')
+
+    elif action in ('subscribe', 'unsubscribe'):
+        raise ValueError(f"{action} 仅支持 asyncio 服务模式的独立请求")
+
+    elif action == 'batch':
+        # 一次往返执行多个请求，按顺序返回各自的完整响应
+        sub_requests = req.get('requests')
+        if not isinstance(sub_requests, list):
+            raise ValueError("batch 请求缺少 requests 列表")
+        if len(sub_requests) > MAX_BATCH_SIZE:
+            raise ValueError(f"batch 子请求数超过上限 {MAX_BATCH_SIZE}")
+        parts = []
+        for sub_req in sub_requests:
+            if not isinstance(sub_req, dict) or sub_req.get('action') == 'batch':
+                parts.append(JsonResponse.make(False, "Invalid batch item").encode('utf-8'))
+            else:
+                parts.append(safe_dispatch(sub_req))
+        return JsonResponse.make_raw(True, "OK", b"[" + b", ".join(parts) + b"]")
+
+    return JsonResponse.make(False, "Unknown action").encode('utf-8')
+
+
+def safe_dispatch(req: dict) -> bytes:
+    """执行请求，异常时返回失败响应而不是抛出。"""
+    try:
+        return dispatch_request(req)
+    except Exception as e:
+        return JsonResponse.make(False, str(e)).encode('utf-8')
+
+
 class TrafficTCPHandler(socketserver.StreamRequestHandler):
     def handle(self):
         # 获取客户端 IP 和 端口
@@ -66,6 +409,7 @@ class TrafficTCPHandler(socketserver.StreamRequestHandler):
 
         # 打印连接信息
         print(f"\n[Server] 新客户端连接: {client_ip}:{client_port}")
+        TCP_CONNECTIONS["thread"].inc()
 
         try:
             while True:
@@ -81,43 +425,230 @@ class TrafficTCPHandler(socketserver.StreamRequestHandler):
                 # 打印接收到的原始数据
                 print(f"[Server] 收到来自 {client_ip} 的消息: {req_str}")
 
+                request_start = time.perf_counter()
                 try:
                     req = json.loads(req_str)
-                    action = req.get('action')
-
-                    if action == 'read':
-                        seg_id = int(req.get('segID', 0))
-                        count = int(req.get('hisTime', 1))
-                        print(f"[Server] 执行动作: read (SegID={seg_id}, Count={count})")
-
-                        data = db.get_data(seg_id=seg_id, count=count)
-                        self.wfile.write(JsonResponse.make(True, "OK", data).encode('utf-8'))
-
-                    elif action == 'readall':
-                        print(f"[Server] 执行动作: readall")
-                        data = db.get_data(read_all=True)
-                        self.wfile.write(JsonResponse.make(True, "OK", data).encode('utf-8'))
-                    else:
-                        print(f"[Server] 未知动作: {action}")
-                        self.wfile.write(JsonResponse.make(False, "Unknown action").encode('utf-8'))
+                    count_request(req)
+                    print(f"[Server] 执行动作: {req.get('action')}")
+                    payload = dispatch_request(req)
 
                 except Exception as e:
                     print(f"[Server] 处理请求出错: {e}")
-                    self.wfile.write(JsonResponse.make(False, str(e)).encode('utf-8'))
+                    payload = JsonResponse.make(False, str(e)).encode('utf-8')
+                TCP_LATENCY["thread"].observe(time.perf_counter() - request_start)
+                self.wfile.write(payload)
         except ConnectionResetError:
             print(f"[Server] 客户端 {client_ip} 强制断开连接")
         except Exception as e:
             print(f"[Server] 通信异常: {e}")
         finally:
+            TCP_CONNECTIONS["thread"].dec()
             print(f"[Server] 客户端断开: {client_ip}:{client_port}")
 
 
-def start_traffic_server(taskConfig: TrafficTaskConfig) -> socketserver.ThreadingTCPServer:
-    """启动 TCP 服务 (Daemon线程)"""
+class _Subscription:
+    """单个连接的订阅状态：路段过滤条件与待推送队列。"""
+
+    def __init__(self, writer: asyncio.StreamWriter, seg_ids: Optional[FrozenSet[int]]):
+        self.writer = writer
+        self.seg_ids = seg_ids
+        # 只保留最新一轮待推送数据，消费不及时则新数据覆盖旧数据（合并推送）
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.task: Optional[asyncio.Task] = None
+
+    def offer(self, payload: bytes) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                payload = await self.queue.get()
+                self.writer.write(payload)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+class AsyncTrafficServer:
+    """
+    asyncio 模式 TCP 服务：单线程事件循环承载全部连接。
+    协议为换行分隔的 JSON，每行一个请求，响应同样以换行结尾；
+    同一连接可连续发送多个请求（流水线），响应按请求顺序返回。
+    """
+
+    def __init__(self, host: str, port: int, max_line_bytes: int = 65536, push_max_buffer_bytes: int = 1 << 20,
+                 dispatch_workers: int = 8):
+        self.host = host
+        self.port = port
+        self.max_line_bytes = max_line_bytes
+        self.push_max_buffer_bytes = push_max_buffer_bytes
+        # 缓存命中直接在事件循环中应答，其余请求（加锁读取、文件扫描、解压等）交给线程池，
+        # 慢请求只阻塞发起它的连接，不影响其他连接
+        self._dispatch_pool = ThreadPoolExecutor(max_workers=max(1, dispatch_workers),
+                                                 thread_name_prefix="AsyncDispatch")
+        self.loop = asyncio.new_event_loop()
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._subscriptions: Dict[asyncio.StreamWriter, _Subscription] = {}
+        g_history_store.add_listener(self._on_new_frame)
+
+    def _on_new_frame(self, generation: int, rows: List[HistoryRow]) -> None:
+        """轮询线程回调：转交事件循环线程进行推送。"""
+        if self._subscriptions and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._publish, generation, rows)
+
+    def _publish(self, generation: int, rows: List[HistoryRow]) -> None:
+        """将新一轮数据推送给所有订阅者，相同过滤条件的订阅者共用一次编码结果。"""
+        encoded: Dict[Optional[FrozenSet[int]], bytes] = {}
+        for writer, sub in list(self._subscriptions.items()):
+            # 积压超过上限的慢订阅者直接断开，避免拖累整体推送
+            if writer.transport.get_write_buffer_size() > self.push_max_buffer_bytes:
+                self._unsubscribe(writer)
+                writer.close()
+                continue
+
+            payload = encoded.get(sub.seg_ids)
+            if payload is None:
+                frames = {}
+                for row in rows:
+                    if sub.seg_ids is None or row.seg_id in sub.seg_ids:
+                        frames[f"seg_{row.seg_id:02d}"] = [db._fmt(row)]
+                payload = JsonResponse.make_raw(True, "push", json.dumps(
+                    {"cursor": generation, "frames": frames}, ensure_ascii=False
+                ).encode('utf-8')) + b"\n"
+                encoded[sub.seg_ids] = payload
+            sub.offer(payload)
+
+    def _subscribe(self, writer: asyncio.StreamWriter, req: dict) -> bytes:
+        seg_ids = req.get('segIDs')
+        seg_filter = frozenset(int(i) for i in seg_ids) if seg_ids else None
+        self._unsubscribe(writer)
+        sub = _Subscription(writer, seg_filter)
+        sub.task = self.loop.create_task(sub.run())
+        self._subscriptions[writer] = sub
+        TCP_SUBSCRIBERS.set(len(self._subscriptions))
+        return JsonResponse.make(True, "subscribed", {
+            "segIDs": sorted(seg_filter) if seg_filter else None,
+            "cursor": g_history_store.generation
+        }).encode('utf-8')
+
+    def _unsubscribe(self, writer: asyncio.StreamWriter) -> bool:
+        sub = self._subscriptions.pop(writer, None)
+        if sub is None:
+            return False
+        sub.task.cancel()
+        TCP_SUBSCRIBERS.set(len(self._subscriptions))
+        return True
+
+    def start(self) -> None:
+        """在 Daemon 线程中启动事件循环，监听成功后返回。"""
+        self._thread = threading.Thread(target=self._run, name="AsyncTrafficServer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self._server = self.loop.run_until_complete(asyncio.start_server(
+            self._handle_client, self.host, self.port,
+            limit=self.max_line_bytes, reuse_address=True
+        ))
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        TCP_CONNECTIONS["asyncio"].inc()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 单行超过 max_line_bytes，无法再恢复帧边界，直接断开
+                    writer.write(JsonResponse.make(False, "Request too large").encode('utf-8') + b"\n")
+                    break
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+
+                request_start = time.perf_counter()
+                try:
+                    req = json.loads(line)
+                    if not isinstance(req, dict):
+                        raise ValueError("请求必须为 JSON 对象")
+                    count_request(req)
+                    action = req.get('action')
+                    if action == 'subscribe':
+                        payload = self._subscribe(writer, req)
+                    elif action == 'unsubscribe':
+                        payload = JsonResponse.make(True, "unsubscribed", self._unsubscribe(writer)).encode('utf-8')
+                    else:
+                        payload = probe_cache(req)
+                        if payload is None:
+                            payload = await self.loop.run_in_executor(self._dispatch_pool, dispatch_request, req)
+                except Exception as e:
+                    payload = JsonResponse.make(False, str(e)).encode('utf-8')
+                TCP_LATENCY["asyncio"].observe(time.perf_counter() - request_start)
+
+                writer.write(payload + b"\n")
+                # 客户端读取过慢时在此等待，暂停读取其后续请求（背压）
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # 客户端断开或服务关闭，连接处理到此结束
+            pass
+        finally:
+            self._unsubscribe(writer)
+            TCP_CONNECTIONS["asyncio"].dec()
+            writer.close()
+
+    async def _stop(self) -> None:
+        self._server.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+    def shutdown(self) -> None:
+        """停止监听、断开所有连接并结束事件循环。"""
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop)
+        if self._thread is not None:
+            self._thread.join()
+        self._dispatch_pool.shutdown(wait=False)
+
+    def server_close(self) -> None:
+        """与 socketserver 接口保持一致，释放事件循环。"""
+        if not self.loop.is_running():
+            self.loop.close()
+
+
+def start_traffic_server(taskConfig: TrafficTaskConfig):
+    """启动 TCP 服务 (Daemon线程)，server_mode 为 "asyncio" 时使用 AsyncTrafficServer"""
     # 配置服务器地址和端口
     SERVER_HOST = taskConfig.server_ip
     SERVER_PORT = taskConfig.server_port
 
+    # 超出内存深度的历史查询读取持久化历史文件
+    if taskConfig.history_file:
+        db.history_file = TrafficHistoryFile(taskConfig.history_file)
+        # 后台预建路段索引，首次深度查询无需扫描整个文件
+        threading.Thread(target=db.history_file.build_index, name="HistoryIndex", daemon=True).start()
+    # raw 动作读取原始 JSON 归档
+    if taskConfig.raw_archive_dir:
+        db.raw_archive = TrafficRawArchive(taskConfig.raw_archive_dir)
+
+    if taskConfig.server_mode == "asyncio":
+        server = AsyncTrafficServer(
+            SERVER_HOST, SERVER_PORT,
+            taskConfig.server_max_line_bytes, taskConfig.push_max_buffer_bytes,
+            taskConfig.server_dispatch_workers
+        )
+        server.start()
+        return server
+
     socketserver.ThreadingTCPServer.allow_reuse_address = True
     server = socketserver.ThreadingTCPServer((SERVER_HOST, SERVER_PORT), TrafficTCPHandler)
     t = threading.Thread(target=server.serve_forever, daemon=True)
@@ -0,0 +1,194 @@
+"""
+SpatialIndex.py
+路段空间索引：均匀网格，按路段起终点连线的外包矩形登记到覆盖的所有网格单元。
+视口 (bbox) 查询只检查与视口相交的单元，再对候选路段做线段与矩形的精确相交判断；
+邻近 (near) 查询按半径或从中心单元逐圈向外扩展求 k 近邻，距离为点到线段的最短距离(米)。
+网格在 TrafficManager.load_config 中随路段配置一同构建。
+"""
+import math
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from globals import RoadSegment
+
+# 每纬度对应的米数（近似）
+METERS_PER_DEGREE = 111320.0
+
+
+def _clip_segment(x0: float, y0: float, x1: float, y1: float,
+                  min_x: float, min_y: float, max_x: float, max_y: float) -> bool:
+    """Liang-Barsky 裁剪：判断线段是否与矩形相交。"""
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - min_x), (dx, max_x - x0), (-dy, y0 - min_y), (dy, max_y - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return False
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return False
+            t1 = min(t1, t)
+    return t0 <= t1
+
+
+class SegmentSpatialIndex:
+    """路段均匀网格索引，构建后只读，查询线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        # seg_id -> (start_lat, start_lon, end_lat, end_lon)
+        self._geometry: Dict[int, Tuple[float, float, float, float]] = {}
+        self.cell_size = 0.01
+        self._origin = (0.0, 0.0)
+        self._extent = (0, 0, -1, -1)   # 网格单元行列范围 (min_row, min_col, max_row, max_col)
+
+    def __len__(self) -> int:
+        return len(self._geometry)
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (int(math.floor((lat - self._origin[0]) / self.cell_size)),
+                int(math.floor((lon - self._origin[1]) / self.cell_size)))
+
+    def build(self, segments: List[RoadSegment], cell_size: float = 0) -> None:
+        """根据路段坐标构建网格。
+        :param
+            segments (List[RoadSegment]): 路段列表。
+            cell_size (float): 网格边长(度)，<=0 时按路段分布自动选择，使每个单元平均约含一个路段。
+        :return
+            None
+        """
+        geometry = {seg.id: (seg.start_lat, seg.start_lon, seg.end_lat, seg.end_lon) for seg in segments}
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        origin = (0.0, 0.0)
+        if geometry:
+            lats = [v for g in geometry.values() for v in (g[0], g[2])]
+            lons = [v for g in geometry.values() for v in (g[1], g[3])]
+            origin = (min(lats), min(lons))
+            if cell_size <= 0:
+                area = max((max(lats) - origin[0]) * (max(lons) - origin[1]), 1e-8)
+                cell_size = max(math.sqrt(area / len(geometry)), 1e-4)
+
+        with self._lock:
+            self.cell_size = cell_size if cell_size > 0 else 0.01
+            self._origin = origin
+            for seg_id, (lat0, lon0, lat1, lon1) in geometry.items():
+                row0, col0 = self._cell_of(min(lat0, lat1), min(lon0, lon1))
+                row1, col1 = self._cell_of(max(lat0, lat1), max(lon0, lon1))
+                for row in range(row0, row1 + 1):
+                    for col in range(col0, col1 + 1):
+                        cells.setdefault((row, col), []).append(seg_id)
+            self._cells = cells
+            self._geometry = geometry
+            if cells:
+                rows = [cell[0] for cell in cells]
+                cols = [cell[1] for cell in cells]
+                self._extent = (min(rows), min(cols), max(rows), max(cols))
+            else:
+                self._extent = (0, 0, -1, -1)
+        print(f"路段空间索引: {len(geometry)} 个路段，{len(cells)} 个网格单元，单元边长 {self.cell_size:.5f} 度")
+
+    def bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+        """视口查询：返回与矩形相交的路段 ID（按 ID 排序）。
+        :param
+            min_lat, min_lon, max_lat, max_lon (float): 视口范围。
+        :return
+            List[int]: 路段 ID 列表。
+        """
+        with self._lock:
+            cells, geometry = self._cells, self._geometry
+            extent = self._extent
+            row0, col0 = self._cell_of(min_lat, min_lon)
+            row1, col1 = self._cell_of(max_lat, max_lon)
+        # 视口超出网格范围的部分没有路段，裁掉以免遍历空单元
+        row0, col0 = max(row0, extent[0]), max(col0, extent[1])
+        row1, col1 = min(row1, extent[2]), min(col1, extent[3])
+
+        found: Set[int] = set()
+        checked: Set[int] = set()
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                for seg_id in cells.get((row, col), ()):
+                    if seg_id in checked:
+                        continue
+                    checked.add(seg_id)
+                    lat0, lon0, lat1, lon1 = geometry[seg_id]
+                    if _clip_segment(lon0, lat0, lon1, lat1, min_lon, min_lat, max_lon, max_lat):
+                        found.add(seg_id)
+        return sorted(found)
+
+    @staticmethod
+    def distance_to_segment(lat: float, lon: float, geometry: Tuple[float, float, float, float]) -> float:
+        """点到路段连线的最短距离(米)，局部按等距柱状投影近似。"""
+        lat0, lon0, lat1, lon1 = geometry
+        kx = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        ky = METERS_PER_DEGREE
+        ax, ay = (lon0 - lon) * kx, (lat0 - lat) * ky
+        bx, by = (lon1 - lon) * kx, (lat1 - lat) * ky
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        t = 0.0 if length2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length2))
+        return math.hypot(ax + t * dx, ay + t * dy)
+
+    def near(self, lat: float, lon: float, radius: Optional[float] = None,
+             k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """邻近查询：返回半径内（或最近的 k 个，或二者同时满足）的路段及其距离，按距离从近到远排列。
+        :param
+            lat, lon (float): 中心点坐标。
+            radius (Optional[float]): 半径(米)，None 表示不限半径。
+            k (Optional[int]): 最多返回的路段数，None 表示返回半径内全部路段。
+        :return
+            List[Tuple[int, float]]: [(seg_id, 距离(米)), ...]。
+        """
+        if radius is None and not k:
+            raise ValueError("near 查询需要 radius 或 k")
+        with self._lock:
+            cells, geometry, cell_size, extent = self._cells, self._geometry, self.cell_size, self._extent
+            center_row, center_col = self._cell_of(lat, lon)
+        if not geometry:
+            return []
+
+        # 一个网格单元在经纬两个方向上对应的最短米数，用于判断外圈是否还可能有更近的路段
+        cell_meters = cell_size * METERS_PER_DEGREE * min(1.0, math.cos(math.radians(lat)))
+        min_row, min_col, max_row, max_col = extent
+        # 中心点在网格外时，从第一个与网格相交的圈开始；最大圈数为到网格最远角的距离
+        first_ring = max(0, min_row - center_row, center_row - max_row, min_col - center_col, center_col - max_col)
+        max_ring = max(abs(center_row - min_row), abs(center_row - max_row),
+                       abs(center_col - min_col), abs(center_col - max_col))
+        if radius is not None:
+            max_ring = min(max_ring, int(math.ceil(radius / cell_meters)) + 1)
+
+        candidates: Dict[int, float] = {}
+        for ring in range(first_ring, max_ring + 1):
+            # 每圈只遍历落在网格范围内的单元
+            top, bottom = center_row - ring, center_row + ring
+            left, right = center_col - ring, center_col + ring
+            col_lo, col_hi = max(left, min_col), min(right, max_col)
+            for row in range(max(top, min_row), min(bottom, max_row) + 1):
+                if row in (top, bottom):
+                    cols = range(col_lo, col_hi + 1)
+                else:
+                    cols = [col for col in (left, right) if min_col <= col <= max_col]
+                for col in cols:
+                    for seg_id in cells.get((row, col), ()):
+                        if seg_id not in candidates:
+                            candidates[seg_id] = self.distance_to_segment(lat, lon, geometry[seg_id])
+            # 第 ring 圈以外的单元与中心点的距离至少为 ring * cell_meters
+            if k and len(candidates) >= k:
+                kth = sorted(candidates.values())[k - 1]
+                if kth <= ring * cell_meters:
+                    break
+
+        result = sorted(((seg_id, d) for seg_id, d in candidates.items()
+                         if radius is None or d <= radius), key=lambda item: item[1])
+        return result[:k] if k else result
+
+
+# 全局路段空间索引，由 TrafficManager.load_config 构建，供 TCP 服务查询
+g_spatial_index = SegmentSpatialIndex()
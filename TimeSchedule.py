@@ -1,22 +1,18 @@
+import heapq
 import threading
-from dataclasses import dataclass
 import time
-from datetime import datetime, timedelta, time as dt_time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Dict, List, Set, Tuple
 
-from BMap import TrafficManager
+from BMap import CYCLE_SECONDS, LAST_CYCLE_SECONDS, TrafficManager
+from globals import RoadSegment, RoutineBMapData, TrafficTaskConfig
+from Metrics import g_metrics
+from Sharding import ShardedPoller
 
-
-@dataclass
-class TrafficTaskConfig:
-    """
-    任务配置结构体
-    """
-    start_time: dt_time      # 开始时间
-    end_time: dt_time        # 结束时间
-    interval_seconds: int    # 时段内的轮询间隔
-    segment_table_path: str  # 路段数据文件路径
-    server_ip: str           # 服务器监听IP
-    server_port: int         # 服务器监听端口
+CYCLES_STARTED = g_metrics.counter("bmap_cycles_started_total", "已启动的轮询次数")
+CYCLES_SKIPPED = g_metrics.counter("bmap_cycles_skipped_total", "因上一轮未结束而跳过的轮询次数")
+SCHEDULER_LAG = g_metrics.histogram("bmap_scheduler_lag_seconds", "错峰调度中路段实际查询时间相对计划时间的延迟")
 
 
 def is_current_in_schedule(config: TrafficTaskConfig) -> bool:
@@ -40,15 +36,198 @@ def is_current_in_schedule(config: TrafficTaskConfig) -> bool:
 traffic_monitor_task_end_event = threading.Event()
 
 
+class _Batch:
+    """错峰调度中一批查询的状态。"""
+
+    __slots__ = ("batch_time", "started", "indexes", "released")
+
+    def __init__(self, batch_time: float, indexes: List[int]):
+        self.batch_time = batch_time          # 批次开始时间 (Unix 时间戳)
+        self.started = time.perf_counter()
+        self.indexes = indexes                # 路段在配置中的序号
+        self.released = False                 # 查询已结束、路段已移出查询中集合
+
+
+class StaggeredScheduler:
+    """
+    错峰调度器：以优先队列维护每个路段的下次查询时间 (time.monotonic)。
+    每个道路等级可配置独立的轮询间隔，同一等级的路段在间隔内均匀错开，
+    请求速率因此平滑分布在整个间隔内，而不是集中在整刻度爆发。
+    到期的路段作为一批提交到批次线程池查询，调度线程不等待查询完成，
+    个别路段重试变慢不会推迟其他路段；已完成的批次按提交顺序每隔 stagger_flush_seconds 合并为一帧写入历史，
+    帧时间取帧内最晚一批的开始时间，保证写入历史的时间单调不减。
+    """
+
+    def __init__(self, manager: TrafficManager, config: TrafficTaskConfig):
+        """
+        :param
+            manager (TrafficManager): 负责查询与保存数据的管理器。
+            config (TrafficTaskConfig): 任务配置。
+        :return
+            None
+        """
+        self.manager = manager
+        self.config = config
+        self.flush_seconds = max(0.5, config.stagger_flush_seconds)
+        # 堆元素：(下次查询时间, 路段在配置中的序号)，序号同时保证同一时刻的顺序稳定
+        self._heap: List[Tuple[float, int]] = []
+        self._pending: RoutineBMapData = []
+        self._pending_ids: Set[int] = set()
+        self._pending_time = None
+        # 未合并的批次，按提交顺序排列
+        self._batch_pool = ThreadPoolExecutor(max_workers=max(2, min(8, config.fetch_workers)),
+                                              thread_name_prefix="StaggerBatch")
+        self._running: Dict[Future, _Batch] = {}
+        # 正在查询的路段序号，上一次查询未完成时跳过本次
+        self._in_flight: Set[int] = set()
+
+    def interval_for(self, seg: RoadSegment) -> float:
+        """路段所属等级的轮询间隔(秒)。"""
+        return max(1.0, float(self.config.grade_intervals.get(seg.grade, self.config.interval_seconds)))
+
+    def _build_heap(self, start: float) -> None:
+        """按等级分组，将同一等级的路段在其间隔内均匀错开。"""
+        groups: Dict[float, List[int]] = {}
+        for index, seg in enumerate(self.manager.segments):
+            groups.setdefault(self.interval_for(seg), []).append(index)
+        self._heap = []
+        for interval, indexes in groups.items():
+            step = interval / len(indexes)
+            for k, index in enumerate(indexes):
+                self._heap.append((start + k * step, index))
+            print(f"[Scheduler] 间隔 {interval:g} 秒: {len(indexes)} 个路段，每 {step:.3f} 秒一个")
+        heapq.heapify(self._heap)
+
+    def _flush(self) -> None:
+        if self._pending:
+            cycle_id = self.manager.commit_frame(self._pending, self._pending_time)
+            print(f"[Scheduler] 第 {cycle_id} 帧写入 {len(self._pending)} 个路段")
+            self.manager.report_parse_stats()
+        self._pending = []
+        self._pending_ids = set()
+        self._pending_time = None
+
+    def _query_batch(self, segs: List[RoadSegment], now_str: str) -> RoutineBMapData:
+        """批次线程池中执行：每批使用独立的重试截止时间，并发批次互不影响。解析耗时不在此重置，按帧统计。"""
+        return self.manager.query_segments(segs, now_str, self.manager.new_deadline())
+
+    def run_once(self, now: float) -> int:
+        """将所有已到期的路段作为一批提交查询，并为其安排下一次查询时间。
+        :param
+            now (float): 当前 time.monotonic()。
+        :return
+            int: 本次提交查询的路段数量。
+        """
+        segments = self.manager.segments
+        due: List[int] = []
+        while self._heap and self._heap[0][0] <= now:
+            due_time, index = heapq.heappop(self._heap)
+            SCHEDULER_LAG.observe(now - due_time)
+            if index in self._in_flight:
+                # 上一次查询仍在重试中，本次跳过
+                CYCLES_SKIPPED.inc()
+            else:
+                due.append(index)
+            # 保持原有相位；若已落后一个间隔以上（处理耗时过长或系统休眠），跳过错过的时刻
+            interval = self.interval_for(segments[index])
+            next_time = due_time + interval
+            if next_time <= now:
+                next_time += ((now - next_time) // interval + 1) * interval
+            heapq.heappush(self._heap, (next_time, index))
+
+        if not due or not is_current_in_schedule(self.config):
+            return 0
+
+        batch_time = time.time()
+        now_str = datetime.fromtimestamp(batch_time).strftime("%H:%M:%S")
+        future = self._batch_pool.submit(self._query_batch, [segments[i] for i in due], now_str)
+        self._running[future] = _Batch(batch_time, due)
+        self._in_flight.update(due)
+        CYCLES_STARTED.inc()
+        return len(due)
+
+    def _collect(self) -> None:
+        """收集已完成的批次并计入待写入帧。
+        批次可能乱序完成：查询结束即释放路段并记录耗时，但结果只按提交顺序合并，
+        先提交的批次未完成时其后的批次等待，避免帧时间倒退。同一路段在帧内重复时先写出已有的帧。"""
+        for future, batch in self._running.items():
+            if future.done() and not batch.released:
+                batch.released = True
+                self._in_flight.difference_update(batch.indexes)
+                batch_seconds = time.perf_counter() - batch.started
+                CYCLE_SECONDS.observe(batch_seconds)
+                LAST_CYCLE_SECONDS.set(batch_seconds)
+
+        while self._running:
+            future = next(iter(self._running))
+            if not future.done():
+                break
+            batch = self._running.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"\n[Scheduler] 批次查询出错: {e}")
+                continue
+            if any(res.seg_id in self._pending_ids for res in results):
+                self._flush()
+            self._pending_time = max(self._pending_time or 0.0, batch.batch_time)
+            self._pending.extend(results)
+            self._pending_ids.update(res.seg_id for res in results)
+
+    def run(self, stop_event: threading.Event) -> None:
+        """调度主循环，直到 stop_event 被设置；退出前等待查询中的批次并写入尚未合并的结果。"""
+        start = time.monotonic()
+        self._build_heap(start)
+        next_flush = start + self.flush_seconds
+        try:
+            while not stop_event.is_set():
+                try:
+                    now = time.monotonic()
+                    self.run_once(now)
+                    self._collect()
+                    if now >= next_flush:
+                        self._flush()
+                        next_flush = now + self.flush_seconds
+                except Exception as e:
+                    print(f"\n[Scheduler] 调度出错: {e}")
+                    stop_event.wait(1)
+
+                wake = min(self._heap[0][0] if self._heap else next_flush, next_flush)
+                timeout = min(1.0, wake - time.monotonic())
+                if timeout > 0:
+                    if self._running:
+                        # 有批次在查询时，任一批次完成即醒来收集
+                        wait(list(self._running), timeout=timeout, return_when=FIRST_COMPLETED)
+                    else:
+                        stop_event.wait(timeout)
+        finally:
+            self._batch_pool.shutdown(wait=True)
+            self._collect()
+            self._flush()
+
+
 def traffic_monitor_task(taskConfig: TrafficTaskConfig):
     """
     交通数据监控任务线程函数。
-    按照配置的时间段和间隔，定时启动子线程执行交通数据查询。
+    按照配置的时间段和间隔，定时启动子线程执行交通数据查询；
+    scheduler_mode 为 "staggered" 时改用 StaggeredScheduler 按路段错峰查询。
     线程可通过 traffic_monitor_task_end_event 事件安全终止。
     :param taskConfig: 任务配置对象，包含时间段和间隔信息。
     :return:
     """
-    TrafficManagerObj = TrafficManager(config_file=taskConfig.segment_table_path)
+    TrafficManagerObj = TrafficManager(taskConfig)
+    if taskConfig.shard_processes > 1:
+        # 路段分给多个工作进程请求与解析，本进程只负责合并结果与写入
+        TrafficManagerObj.shard_pool = ShardedPoller(TrafficManagerObj, taskConfig, taskConfig.shard_processes)
+
+    if taskConfig.scheduler_mode == "staggered":
+        print("线程启动，按路段错峰调度。")
+        try:
+            StaggeredScheduler(TrafficManagerObj, taskConfig).run(traffic_monitor_task_end_event)
+        finally:
+            TrafficManagerObj.close()
+        return
+
     current_worker_thread = None
 
     interval = taskConfig.interval_seconds
@@ -82,6 +261,7 @@ def traffic_monitor_task(taskConfig: TrafficTaskConfig):
             if is_current_in_schedule(taskConfig):
                 if current_worker_thread is not None and current_worker_thread.is_alive():
                     print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 警告：上一轮任务尚未结束，跳过本次调度！")
+                    CYCLES_SKIPPED.inc()
                 else:
                     print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 启动子线程执行 API 查询...")
                     current_worker_thread = threading.Thread(
@@ -89,6 +269,7 @@ def traffic_monitor_task(taskConfig: TrafficTaskConfig):
                         daemon=True
                     )
                     current_worker_thread.start()
+                    CYCLES_STARTED.inc()
             else:
                 # 不在时段内：什么都不做，直接跳过，准备计算下一次
                 print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 当前不在运行时间段内，跳过。")
@@ -109,4 +290,7 @@ def traffic_monitor_task(taskConfig: TrafficTaskConfig):
 
         except Exception as e:
             print(f"\n线程运行出错: {e}")
-            time.sleep(5)  # 出错后稍微等待再重试
\ No newline at end of file
+            time.sleep(5)  # 出错后稍微等待再重试
+
+    # 线程退出前释放查询线程池
+    TrafficManagerObj.close()
\ No newline at end of file
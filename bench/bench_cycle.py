@@ -0,0 +1,110 @@
+"""
+bench_cycle.py
+轮询周期基准：对模拟 API 端到端计时 TrafficManager.task_query_all_segments，
+覆盖不同路段规模、并发线程数、响应延迟与错误率，结果写入 JSON。
+
+运行：python bench/bench_cycle.py --sizes 16 1000 --cycles 3 -o bench/results/cycle.json
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import time as dt_time
+
+from common import quiet, summarize, write_results
+from gen_segments import generate_segments
+from stub_api import StubBaiduApi
+
+from BMap import TrafficManager
+from globals import RetryPolicy, TrafficTaskConfig
+
+# 默认场景：(名称, 并发线程数, 响应延迟, 错误率, 适用的最大路段数)
+# 串行场景每轮耗时与路段数成正比，只在小规模下运行
+DEFAULT_SCENARIOS = (
+    ("sequential", 1, 0.02, 0.0, 200),
+    ("workers8", 8, 0.02, 0.0, None),
+    ("workers32", 32, 0.02, 0.0, None),
+    ("workers32_errors", 32, 0.02, 0.05, None),
+)
+
+
+def run_scenario(stub: StubBaiduApi, work_dir: str, segments_path: str, size: int, name: str,
+                 workers: int, latency: float, error_rate: float, cycles: int, verbose: bool) -> dict:
+    """运行单个场景，返回该场景的统计结果。"""
+    stub.latency = latency
+    stub.error_rate = error_rate
+    scenario_dir = os.path.join(work_dir, f"{name}_{size}")
+    config = TrafficTaskConfig(
+        start_time=dt_time(0, 0), end_time=dt_time(23, 59), interval_seconds=30,
+        segment_table_path=segments_path, server_ip="127.0.0.1", server_port=0,
+        fetch_workers=workers, qps_limit=0,
+        history_file=os.path.join(scenario_dir, "history.bin"),
+        raw_archive_dir=os.path.join(scenario_dir, "raw"),
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0.05, max_delay=0.5),
+    )
+
+    durations = []
+    requests_per_cycle = []
+    errors = 0
+    with quiet(not verbose):
+        manager = TrafficManager(config, output_dir=scenario_dir)
+        try:
+            for _ in range(cycles):
+                stub.reset_counters()
+                start = time.perf_counter()
+                manager.task_query_all_segments()
+                durations.append(time.perf_counter() - start)
+                requests_per_cycle.append(stub.request_count)
+                errors += stub.error_count
+        finally:
+            manager.close()
+
+    stats = summarize(durations)
+    return {
+        "scenario": name, "segments": size, "fetch_workers": workers,
+        "stub_latency": latency, "stub_error_rate": error_rate, "cycles": cycles,
+        "cycle_seconds": stats,
+        "segments_per_second": round(size / stats["p50"], 2) if stats.get("p50") else None,
+        "api_requests_per_cycle": round(sum(requests_per_cycle) / len(requests_per_cycle), 1),
+        "api_errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="轮询周期端到端基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 1000], help="路段规模，可选 16 / 1000 / 10000")
+    parser.add_argument("--cycles", type=int, default=3, help="每个场景运行的轮数")
+    parser.add_argument("--scenarios", nargs="+", default=None, help="只运行指定名称的场景")
+    parser.add_argument("--latency", type=float, default=None, help="覆盖所有场景的模拟响应延迟(秒)")
+    parser.add_argument("--payload-roads", type=int, default=1, help="交通态势响应中的道路条数")
+    parser.add_argument("-o", "--output", default="bench/results/cycle.json")
+    parser.add_argument("-v", "--verbose", action="store_true", help="显示被测代码的日志输出")
+    args = parser.parse_args()
+
+    scenarios = [s for s in DEFAULT_SCENARIOS if not args.scenarios or s[0] in args.scenarios]
+    stub = StubBaiduApi(port=0, payload_roads=args.payload_roads, seed=1).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bmap_bench_") as work_dir:
+            for size in args.sizes:
+                segments_path = os.path.join(work_dir, f"segments_{size}.csv")
+                generate_segments(segments_path, size, stub.base_url)
+                for name, workers, latency, error_rate, max_segments in scenarios:
+                    if max_segments is not None and size > max_segments:
+                        continue
+                    if args.latency is not None:
+                        latency = args.latency
+                    result = run_scenario(stub, work_dir, segments_path, size, name, workers,
+                                          latency, error_rate, args.cycles, args.verbose)
+                    results.append(result)
+                    print(f"[{name:<18}] {size:>6} 路段  p50 {result['cycle_seconds']['p50']:.3f}s  "
+                          f"{result['segments_per_second']} 路段/s  请求 {result['api_requests_per_cycle']}/轮")
+    finally:
+        stub.stop()
+
+    write_results(args.output, "cycle", vars(args), results)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+bench_load.py
+TCP 服务压测：先用模拟 API 采集若干轮数据，再启动 start_traffic_server，
+由多个并发客户端在长连接上持续发送 read / readall 请求，统计 p50 / p99 延迟和吞吐量，结果写入 JSON。
+
+运行：python bench/bench_load.py --segments 1000 --clients 16 --duration 10 --modes thread asyncio
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import time as dt_time
+
+from common import quiet, summarize, write_results
+from gen_segments import generate_segments
+from stub_api import StubBaiduApi
+
+from BMap import TrafficManager
+from globals import TrafficTaskConfig
+from SocketServer import start_traffic_server
+
+
+class LoadClient:
+    """单个长连接压测客户端。"""
+
+    def __init__(self, host: str, port: int, mode: str):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.mode = mode
+        self._buffer = b""
+
+    def call(self, req: dict) -> dict:
+        self.sock.sendall(json.dumps(req).encode('utf-8') + b"\n")
+        return self._recv()
+
+    def _recv(self) -> dict:
+        # asyncio 模式以换行分帧；线程模式响应无分隔符，接收到能完整解析的 JSON 即结束
+        while True:
+            if self.mode == "asyncio":
+                line, sep, rest = self._buffer.partition(b"\n")
+                if sep:
+                    self._buffer = rest
+                    return json.loads(line)
+            elif self._buffer.endswith(b"}"):
+                try:
+                    resp = json.loads(self._buffer)
+                    self._buffer = b""
+                    return resp
+                except ValueError:
+                    pass
+            chunk = self.sock.recv(1 << 16)
+            if not chunk:
+                raise ConnectionError("服务端关闭连接")
+            self._buffer += chunk
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def run_load(host: str, port: int, mode: str, clients: int, duration: float, seg_count: int,
+             readall_ratio: float, his_time: int) -> dict:
+    """以 clients 个并发连接压测 duration 秒，返回延迟与吞吐统计。"""
+    latencies = {"read": [], "readall": []}
+    failures = [0]
+    lock = threading.Lock()
+    start_event = threading.Event()
+    deadline = [0.0]
+
+    def worker(index: int) -> None:
+        rnd = random.Random(index)
+        local = {"read": [], "readall": []}
+        local_failures = 0
+        client = LoadClient(host, port, mode)
+        try:
+            start_event.wait()
+            while time.perf_counter() < deadline[0]:
+                if rnd.random() < readall_ratio:
+                    action, req = "readall", {"action": "readall"}
+                else:
+                    action, req = "read", {"action": "read", "segID": rnd.randint(1, seg_count), "hisTime": his_time}
+                request_start = time.perf_counter()
+                resp = client.call(req)
+                local[action].append(time.perf_counter() - request_start)
+                if not resp.get("success"):
+                    local_failures += 1
+        finally:
+            client.close()
+        with lock:
+            for action, values in local.items():
+                latencies[action].extend(values)
+            failures[0] += local_failures
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)   # 等待所有连接建立
+    wall_start = time.perf_counter()
+    deadline[0] = wall_start + duration
+    start_event.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+
+    all_latencies = latencies["read"] + latencies["readall"]
+    return {
+        "mode": mode, "clients": clients, "duration_seconds": round(wall, 3),
+        "requests": len(all_latencies), "failures": failures[0],
+        "throughput_rps": round(len(all_latencies) / wall, 1) if wall > 0 else None,
+        "latency_seconds": summarize(all_latencies),
+        "read_latency_seconds": summarize(latencies["read"]),
+        "readall_latency_seconds": summarize(latencies["readall"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP 服务压测")
+    parser.add_argument("--segments", type=int, default=1000, help="路段规模，可选 16 / 1000 / 10000")
+    parser.add_argument("--cycles", type=int, default=5, help="压测前预先采集的轮数")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16], help="并发连接数，可给出多个")
+    parser.add_argument("--duration", type=float, default=10.0, help="每组压测时长(秒)")
+    parser.add_argument("--modes", nargs="+", default=["thread", "asyncio"], choices=["thread", "asyncio"])
+    parser.add_argument("--readall-ratio", type=float, default=0.05, help="readall 请求占比 (0-1)")
+    parser.add_argument("--his-time", type=int, default=5, help="read 请求的 hisTime 参数")
+    parser.add_argument("--port", type=int, default=18890, help="服务起始端口，每种模式依次加 1")
+    parser.add_argument("-o", "--output", default="bench/results/load.json")
+    parser.add_argument("-v", "--verbose", action="store_true", help="显示被测代码的日志输出")
+    args = parser.parse_args()
+
+    stub = StubBaiduApi(port=0, latency=0.0, seed=1).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bmap_bench_") as work_dir:
+            segments_path = os.path.join(work_dir, "segments.csv")
+            generate_segments(segments_path, args.segments, stub.base_url)
+            config = TrafficTaskConfig(
+                start_time=dt_time(0, 0), end_time=dt_time(23, 59), interval_seconds=30,
+                segment_table_path=segments_path, server_ip="127.0.0.1", server_port=args.port,
+                fetch_workers=32, qps_limit=0,
+                history_file=os.path.join(work_dir, "history.bin"),
+                raw_archive_dir=os.path.join(work_dir, "raw"),
+            )
+            with quiet(not args.verbose):
+                manager = TrafficManager(config, output_dir=work_dir)
+                for _ in range(args.cycles):
+                    manager.task_query_all_segments()
+                manager.close()
+
+            for offset, mode in enumerate(args.modes):
+                config.server_mode = mode
+                config.server_port = args.port + offset
+                with quiet(not args.verbose):
+                    server = start_traffic_server(config)
+                try:
+                    for clients in args.clients:
+                        with quiet(not args.verbose):
+                            result = run_load(config.server_ip, config.server_port, mode, clients, args.duration,
+                                              args.segments, args.readall_ratio, args.his_time)
+                        result["segments"] = args.segments
+                        results.append(result)
+                        lat = result["latency_seconds"]
+                        print(f"[{mode:<7}] {clients:>3} 连接  {result['throughput_rps']} req/s  "
+                              f"p50 {lat.get('p50', 0) * 1000:.2f} ms  p99 {lat.get('p99', 0) * 1000:.2f} ms  "
+                              f"失败 {result['failures']}")
+                finally:
+                    server.shutdown()
+                    server.server_close()
+    finally:
+        stub.stop()
+
+    write_results(args.output, "load", vars(args), results)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+common.py
+基准测试公共工具：仓库路径、统计汇总、结果 JSON 输出。
+"""
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """线性插值计算分位数，输入须已排序。"""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def summarize(values: List[float]) -> dict:
+    """汇总一组耗时(秒)：次数、最小、中位数、p90、p99、最大、平均。"""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "min": round(ordered[0], 6),
+        "p50": round(percentile(ordered, 0.5), 6),
+        "p90": round(percentile(ordered, 0.9), 6),
+        "p99": round(percentile(ordered, 0.99), 6),
+        "max": round(ordered[-1], 6),
+        "mean": round(sum(ordered) / len(ordered), 6),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def write_results(path: str, benchmark: str, params: dict, results: List[dict]) -> dict:
+    """将结果连同运行环境信息写入 JSON 文件，便于跨版本对比。
+    :param
+        path (str): 输出文件路径。
+        benchmark (str): 基准名称。
+        params (dict): 运行参数。
+        results (List[dict]): 各场景结果。
+    :return
+        dict: 写入的完整文档。
+    """
+    doc = {
+        "benchmark": benchmark,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, mode='w', encoding='utf-8') as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    return doc
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool = True):
+    """屏蔽被测代码的逐条打印，避免终端输出干扰计时。"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, mode='w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
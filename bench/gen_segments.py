@@ -0,0 +1,70 @@
+"""
+gen_segments.py
+生成基准测试用的路段配置 CSV，格式与 road_segment.csv 一致。
+每条道路配置为两个方向的两条路段，共用同一个交通态势 URL，各自有独立的路径规划 URL，
+与实际配置中双向路段共用道路级查询的情况一致。
+
+单独运行：python bench/gen_segments.py --count 1000 --base-url http://127.0.0.1:18080 -o bench/segments_1000.csv
+"""
+import argparse
+import csv
+import random
+from urllib.parse import quote
+
+FIELDS = ["id", "name", "direction", "grade", "start_lat", "start_lon", "end_lat", "end_lon", "traffic_url", "route_url"]
+DIRECTION_PAIRS = (("南向北", "北向南"), ("东向西", "西向东"))
+
+# 基准测试常用规模
+STANDARD_SIZES = (16, 1000, 10000)
+
+
+def generate_segments(path: str, count: int, base_url: str = "http://127.0.0.1:18080", seed: int = 0) -> int:
+    """生成 count 条路段写入 path。
+    :param
+        path (str): 输出 CSV 路径。
+        count (int): 路段数量。
+        base_url (str): 模拟 API 的地址。
+        seed (int): 随机种子。
+    :return
+        int: 写入的路段数量。
+    """
+    rnd = random.Random(seed)
+    with open(path, mode='w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for i in range(count):
+            road_no = i // 2
+            road = f"测试路{road_no}"
+            directions = DIRECTION_PAIRS[road_no % len(DIRECTION_PAIRS)]
+            lat = 30.0 + rnd.uniform(-0.5, 0.5)
+            lon = 120.0 + rnd.uniform(-0.5, 0.5)
+            writer.writerow({
+                "id": i,
+                "name": road,
+                "direction": directions[i % 2],
+                "grade": rnd.randint(1, 4),
+                "start_lat": round(lat, 6),
+                "start_lon": round(lon, 6),
+                "end_lat": round(lat + rnd.uniform(-0.01, 0.01), 6),
+                "end_lon": round(lon + rnd.uniform(-0.01, 0.01), 6),
+                "traffic_url": f"{base_url}/traffic?road={quote(road)}",
+                "route_url": f"{base_url}/route?seg={i}",
+            })
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成基准测试路段配置")
+    parser.add_argument("--count", type=int, default=STANDARD_SIZES[0], help="路段数量，常用 16 / 1000 / 10000")
+    parser.add_argument("--base-url", default="http://127.0.0.1:18080", help="模拟 API 地址")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None, help="输出路径，默认 segments_<count>.csv")
+    args = parser.parse_args()
+
+    path = args.output or f"segments_{args.count}.csv"
+    generate_segments(path, args.count, args.base_url, args.seed)
+    print(f"已生成 {args.count} 条路段: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+stub_api.py
+本地模拟百度交通态势 / 路径规划 API，用于基准测试，避免调用真实接口消耗配额。
+可配置响应延迟、错误率和响应体大小：
+    /traffic?road=<名称>   返回道路交通态势，拥堵路段描述随机生成
+    /route?seg=<编号>      返回路径规划结果，耗时随机生成
+
+单独运行：python bench/stub_api.py --port 18080 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DIRECTIONS = ("南向北", "北向南", "东向西", "西向东")
+
+
+class StubBaiduApi:
+    """在后台线程中运行的模拟百度 API 服务。"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 18080, latency: float = 0.02,
+                 jitter: float = 0.0, error_rate: float = 0.0, payload_roads: int = 1, seed: int = None):
+        """
+        :param
+            host (str): 监听地址。
+            port (int): 监听端口，0 表示由系统分配。
+            latency (float): 每个请求的基础响应延迟(秒)。
+            jitter (float): 延迟随机抖动上限(秒)，实际延迟为 latency + [0, jitter)。
+            error_rate (float): 返回错误的概率 (0-1)，一半为 HTTP 500，一半为 API 业务错误。
+            payload_roads (int): 交通态势响应中的道路条数，用于控制响应体大小。
+            seed (int): 随机种子，便于复现。
+        :return
+            None
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_roads = max(1, payload_roads)
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self._count_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubBaiduApi":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counters(self) -> None:
+        with self._count_lock:
+            self.request_count = 0
+            self.error_count = 0
+
+    # ---------------- 响应体 ----------------
+
+    def traffic_body(self, road: str) -> dict:
+        rnd = self.random
+        roads = []
+        for i in range(self.payload_roads):
+            roads.append({
+                "road_name": road if i == 0 else f"{road}辅路{i}",
+                "congestion_sections": [
+                    {"section_desc": f"{rnd.choice(DIRECTIONS)}拥堵", "status": rnd.randint(2, 4),
+                     "speed": round(rnd.uniform(5, 30), 2), "congestion_distance": rnd.randint(50, 800)}
+                    for _ in range(rnd.randint(0, 3))
+                ],
+                "status": rnd.randint(1, 4)
+            })
+        return {
+            "status": 0, "message": "成功",
+            "description": f"{road}整体畅通",
+            "evaluation": {"status": rnd.randint(1, 4), "status_desc": "畅通"},
+            "road_traffic": roads
+        }
+
+    def route_body(self) -> dict:
+        rnd = self.random
+        return {
+            "status": 0, "message": "成功",
+            "result": [{"distance": {"value": rnd.randint(500, 3000)}, "duration": {"value": rnd.randint(60, 600)}}]
+        }
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes = b"") -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                delay = stub.latency + (stub.random.random() * stub.jitter if stub.jitter > 0 else 0)
+                if delay > 0:
+                    time.sleep(delay)
+
+                failed = stub.random.random() < stub.error_rate
+                with stub._count_lock:
+                    stub.request_count += 1
+                    stub.error_count += failed
+                if failed:
+                    if stub.random.random() < 0.5:
+                        self._send(500)
+                    else:
+                        self._send(200, json.dumps({"status": 302, "message": "天配额超限，限制访问"},
+                                                   ensure_ascii=False).encode('utf-8'))
+                    return
+
+                if url.path == "/traffic":
+                    body = stub.traffic_body(query.get("road", ["主路"])[0])
+                elif url.path == "/route":
+                    body = stub.route_body()
+                else:
+                    self._send(404)
+                    return
+                self._send(200, json.dumps(body, ensure_ascii=False).encode('utf-8'))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟百度交通 API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.02, help="基础响应延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动上限(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="错误响应概率 (0-1)")
+    parser.add_argument("--payload-roads", type=int, default=1, help="交通态势响应中的道路条数")
+    args = parser.parse_args()
+
+    stub = StubBaiduApi(args.host, args.port, args.latency, args.jitter, args.error_rate, args.payload_roads).start()
+    print(f"模拟 API 已启动: {stub.base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
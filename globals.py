@@ -1,9 +1,73 @@
+import random
 import threading
 from collections import deque
-from dataclasses import dataclass
-from typing import List, Deque
+from dataclasses import dataclass, field
+from datetime import time as dt_time
+from typing import Deque, Dict, List
 # ================= 数据结构定义 =================
 
+@dataclass
+class RetryPolicy:
+    """
+    API 请求重试策略：指数退避 + 随机抖动，并限制每轮总耗时
+    """
+    max_attempts: int = 5        # 单次查询最多尝试次数
+    base_delay: float = 0.3      # 首次重试前的等待(秒)
+    multiplier: float = 2.0      # 每次重试等待时间的增长倍数
+    max_delay: float = 5.0       # 单次等待上限(秒)
+    jitter: float = 0.5          # 抖动比例，实际等待在 [1-jitter, 1+jitter] 倍之间随机
+    cycle_deadline: float = 25.0  # 每轮从开始起允许重试的总时长(秒)，<=0 表示不限制
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        计算第 attempt 次失败后的等待时间。
+        :param attempt: 已失败次数，从 1 开始
+        :return: 等待秒数
+        """
+        delay = min(self.max_delay, self.base_delay * (self.multiplier ** (attempt - 1)))
+        return max(0.0, delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+@dataclass
+class TrafficTaskConfig:
+    """
+    任务配置结构体
+    """
+    start_time: dt_time      # 开始时间
+    end_time: dt_time        # 结束时间
+    interval_seconds: int    # 时段内的轮询间隔
+    segment_table_path: str  # 路段数据文件路径
+    server_ip: str           # 服务器监听IP
+    server_port: int         # 服务器监听端口
+    fetch_workers: int = 1   # 并发查询线程数，1 表示逐个路段串行查询
+    qps_limit: float = 3.0   # 全局请求速率上限(次/秒)，<=0 表示不限流
+    http_pool_size: int = 0  # HTTP 连接池大小，<=0 时与 fetch_workers 一致
+    connect_timeout: float = 3.0  # HTTP 建连超时(秒)
+    read_timeout: float = 5.0     # HTTP 读取超时(秒)
+    fsync_each_cycle: bool = False  # 每轮写入结果文件后是否 fsync 落盘
+    server_mode: str = "thread"     # TCP 服务模式："thread" 每连接一线程，"asyncio" 单线程事件循环
+    server_max_line_bytes: int = 65536  # asyncio 模式下单个请求行的最大字节数
+    push_max_buffer_bytes: int = 1 << 20  # 订阅推送时单连接允许积压的最大字节数，超过则断开该订阅者
+    server_dispatch_workers: int = 8  # asyncio 模式下处理未命中缓存请求的线程数，避免慢请求阻塞事件循环
+    history_depth: int = 20  # 内存中每个路段保留的历史轮数，每路段每轮约 23 字节
+    history_file: str = "./data/history.bin"  # 持久化二进制历史文件路径，为空表示不写入
+    warm_start_frames: int = 20  # 启动时从历史文件恢复的轮数
+    raw_archive_dir: str = "./data/raw"  # 原始 JSON 压缩归档目录，为空表示不归档
+    raw_text_log: bool = False   # 是否额外写入 *_RawJson.txt 文本日志
+    retry_policy: RetryPolicy = field(default_factory=RetryPolicy)  # API 请求重试策略
+    breaker_failure_threshold: int = 3      # 路段连续失败多少轮后熔断，<=0 表示不启用熔断
+    breaker_cooldown_seconds: float = 300.0  # 熔断后多久放行一次探测请求(秒)
+    adaptive_route: bool = False  # 自适应路径规划：交通态势稳定时跳过路径规划请求，沿用上次车速
+    route_stable_cycles: int = 3  # 交通态势连续不变多少轮后开始跳过路径规划请求
+    route_max_staleness_seconds: float = 300.0  # 沿用车速的最长时间(秒)，超过后强制刷新
+    shard_processes: int = 0  # 多进程分片轮询的进程数，<=1 表示在本进程内轮询
+    aggregate_windows: List[int] = field(default_factory=lambda: [300, 900, 3600])  # 滚动聚合窗口长度(秒)
+    metrics_dump_path: str = ""  # 每轮导出 Prometheus 文本指标的文件路径，为空表示不导出
+    scheduler_mode: str = "aligned"  # 调度模式："aligned" 所有路段在整刻度同时轮询，"staggered" 按路段错峰轮询
+    grade_intervals: Dict[int, float] = field(default_factory=dict)  # 错峰模式下各道路等级的轮询间隔(秒)，未配置的等级使用 interval_seconds
+    stagger_flush_seconds: float = 5.0  # 错峰模式下将已完成路段合并为一帧写入历史的间隔(秒)
+
+
 @dataclass
 class RoadSegment:
     """路段配置数据结构。"""
@@ -29,6 +93,7 @@ class TrafficResult:
     speed: float
     raw_json_traffic: str
     raw_json_route: str
+    speed_carried: bool = False  # 车速沿用自上次路径规划结果（自适应路径规划模式下本轮未请求）
 
 
 # 定义容器类型别名
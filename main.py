@@ -2,9 +2,11 @@ import threading
 from TimeSchedule import traffic_monitor_task, TrafficTaskConfig, traffic_monitor_task_end_event
 from datetime import time as dt_time
 from SocketServer import start_traffic_server
+from BMap import warm_start_history
 
 def debug():
     print("Debugging BMapServer...")
+    warm_start_history(myConfig)  # 先恢复历史数据，服务启动后即可读取
     server = start_traffic_server(myConfig)
     traffic_monitor_task_end_event.clear() # 确保线程可以正常运行
     traffic_monitor_thread = threading.Thread(target=traffic_monitor_task, args=(myConfig, ), daemon=True)
@@ -25,7 +27,10 @@ if __name__ == '__main__':
         interval_seconds=30, # 不宜低于30S
         segment_table_path="road_segment.csv",
         server_ip= "0.0.0.0",
-        server_port= 8888
+        server_port= 8888,
+        fetch_workers=8,     # 并发查询线程数
+        qps_limit=10.0,      # 全局请求速率上限，需按百度 AK 配额调整
+        scheduler_mode="staggered",  # 路段在轮询间隔内错峰查询，可用 grade_intervals 为各等级单独设置间隔
     )
 
     main()
\ No newline at end of file